@@ -1,10 +1,11 @@
 import asyncio
 from dataclasses import dataclass, field
-import time, importlib, inspect, os, json
+import time, importlib, inspect, os, json, hashlib
+from concurrent.futures import Future
 from typing import Any, Optional, Dict, Tuple
 from typing import Any, Optional, Dict
 import uuid
-from python.helpers import extract_tools, rate_limiter, files, errors
+from python.helpers import extract_tools, rate_limiter, files, errors, tokens, tool_registry, response_cache
 from python.helpers.print_style import PrintStyle
 from langchain.schema import AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
@@ -13,8 +14,8 @@ from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.language_models.llms import BaseLLM
 from langchain_core.embeddings import Embeddings
 import python.helpers.log as Log
-from python.helpers.dirty_json import DirtyJson
-from python.helpers.defer import DeferredTask
+from python.helpers.dirty_json import DirtyJson, copy_containers
+from python.helpers.defer import DeferredTask, run_in_background
 
 class AgentContext:
 
@@ -89,12 +90,26 @@ class AgentConfig:
     prompts_subdir: str = ""
     memory_subdir: str = ""
     knowledge_subdir: str = ""
+    memory_backend: str = "faiss" # faiss or chroma (pip install chromadb), index, quantization and dedup options are faiss only
+    memory_index_type: str = "flat" # flat, hnsw, ivf or ivfpq
+    memory_index_promote_at: int = 10000
+    memory_quantization: str = "none" # none, fp16, sq8 or pq, lossy indexes re-rank with full vectors kept on disk
+    memory_cache_max_mb: int = 0 # memory budget of loaded memory stores, 0 for no limit
+    memory_cache_idle_seconds: int = 3600
+    memory_search_mode: str = "vector" # vector, lexical, hybrid, or auto for lexical on keyword queries and hybrid otherwise
+    memory_dedup_threshold: float = 0 # relevance above which a new memory is a near-duplicate, ie. 0.95, 0 keeps every memory
+    memory_dedup_action: str = "skip" # skip the new memory or replace the older one, replacing lets a memory drift through small rewordings
+    memory_consolidate_every: int = 0 # inserts between background consolidations of existing duplicates, ie. 50, 0 to disable
     auto_memory_count: int = 3
     auto_memory_skip: int = 2
     rate_limit_seconds: int = 60
     rate_limit_requests: int = 15
     rate_limit_input_tokens: int = 0
     rate_limit_output_tokens: int = 0
+    prompt_caching: bool = False
+    response_cache_enabled: bool = False
+    response_cache_max_mb: int = 100
+    response_cache_max_age_hours: int = 168
     msgs_keep_max: int = 25
     msgs_keep_start: int = 5
     msgs_keep_end: int = 10
@@ -126,7 +141,7 @@ class KillerException(Exception):
     pass
 
 class Agent:
-    
+
     def __init__(self, number:int, config: AgentConfig, context: AgentContext|None = None):
 
         # agent config  
@@ -140,48 +155,65 @@ class Agent:
         self.agent_name = f"Agent {self.number}"
         self.total_tokens = 0
         self.total_cost = 0.0
+        self.total_cached_tokens = 0
 
         self.history = []
+        self.history_tokens: list[int] = [] # token count of each history message, cached when the message is created
+        self.history_summary: HumanMessage | None = None # summary of the middle messages currently in history
+        self.history_cleanup: Future | None = None # background summarization of the middle messages, runs across messages
+        self.memory_skip_counter = 0
+        self.memory_recall: asyncio.Task | None = None # memory recall running ahead of the next generation
+        self.memory_cache: dict[str, tuple[str, str]] = {} # recent history and store version fingerprint of the last recall
         self.last_message = ""
         self.intervention_message = ""
-        self.rate_limiter = rate_limiter.RateLimiter(self.context.log,max_calls=self.config.rate_limit_requests,max_input_tokens=self.config.rate_limit_input_tokens,max_output_tokens=self.config.rate_limit_output_tokens,window_seconds=self.config.rate_limit_seconds)
         self.data = {} # free data object all the tools can use
+        self._system_prompt = ""
+        self._system_prompt_key: tuple = ()
+        self._system_prompt_tokens = 0
+        self.tokenizer = tokens.get_tokenizer(self.config.chat_model)
+        self.utility_tokenizer = tokens.get_tokenizer(self.config.utility_model)
 
         os.chdir(files.get_abs_path("./work_dir")) #change CWD to work_dir
         
 
-    def message_loop(self, msg: str) -> Tuple[str, int, float]:
     async def message_loop(self, msg: str):
         try:
             printer = PrintStyle(italic=True, font_color="#b3ffd9", padding=False)    
             user_message = self.read_prompt("fw.user_message.md", message=msg)
-            await self.append_message(user_message, human=True) # Append the user's input to the history                        
-            memories = await self.fetch_memories(True)
+            self.memory_skip_counter = 0 # recall memories for the new message right away
+            await self.append_message(user_message, human=True) # Append the user's input to the history, starts memory recall
                 
             while True: # let the agent iterate on his thoughts until he stops by using a tool
                 self.context.streaming_agent = self #mark self as current streamer
                 agent_response = ""
+                self.apply_history_cleanup() # swap in the summarized history if it is ready
 
                 try:
 
-                    system = self.read_prompt("agent.system.md", agent_name=self.agent_name) + "\n\n" + self.read_prompt("agent.tools.md")
+                    system = self.get_system_prompt()
                     memories = await self.fetch_memories()
-                    if memories: system+= "\n\n"+memories
+                    if self.config.prompt_caching:
+                        system_message, messages = self.get_cached_prompt_layout(system, memories)
+                    else:
+                        if memories: system+= "\n\n"+memories
+                        system_message, messages = SystemMessage(content=system), self.history
 
                     prompt = ChatPromptTemplate.from_messages([
-                        SystemMessage(content=system),
+                        system_message,
                         MessagesPlaceholder(variable_name="messages") ])
                     
-                    inputs = {"messages": self.history}
+                    inputs = {"messages": messages}
                     chain = prompt | self.config.chat_model
 
-                    formatted_inputs = prompt.format(messages=self.history)
-                    tokens = int(len(formatted_inputs)/4)     
-                    self.rate_limiter.limit_call_and_input(tokens)
+                    input_tokens = self.get_prompt_tokens(memories)
+                    limiter = self.get_rate_limiter(self.config.chat_model)
+                    call_record = await limiter.limit_call_and_input(input_tokens, self.context.log)
                     
                     # output that the agent is starting
                     PrintStyle(bold=True, font_color="green", padding=True, background_color="white").print(f"{self.agent_name}: Generating:")
                     log = self.context.log.log(type="agent", heading=f"{self.agent_name}: Generating:")
+                    parser = DirtyJson() # incremental parser of the streamed tool request
+                    cache_usage: dict[str, int] = {}
                               
                     async for chunk in chain.astream(inputs):
                         await self.handle_intervention(agent_response) # wait for intervention and handle it, if paused
@@ -189,36 +221,31 @@ class Agent:
                         if isinstance(chunk, str): content = chunk
                         elif hasattr(chunk, "content"): content = str(chunk.content)
                         else: content = str(chunk)
+
+                        for key, value in tokens.get_cache_usage(chunk).items(): cache_usage[key] = max(value, cache_usage.get(key, 0))
                         
                         if content:
                             printer.stream(content) # output the agent response stream
                             agent_response += content # concatenate stream into the response
-                            self.log_from_stream(agent_response, log)
+                            self.log_from_stream(agent_response, content, parser, log)
 
-                    output_tokens = int(len(agent_response)/4)
-                    self.rate_limiter.set_output_tokens(output_tokens)
+                    output_tokens = self.tokenizer.count(agent_response)
+                    limiter.set_output_tokens(output_tokens, call_record)
                     
-                    total_tokens = tokens + output_tokens
+                    total_tokens = input_tokens + output_tokens
                     cost = self.calculate_cost(total_tokens)
                     self.total_tokens += total_tokens
                     self.total_cost += cost
-                    self.rate_limiter.set_output_tokens(int(len(agent_response)/4)) # rough estimation
+                    if cache_usage: self.log_cache_usage(cache_usage)
                     
                     await self.handle_intervention(agent_response)
 
-<<<<<<< HEAD
-                        else: #otherwise proceed with tool
-                            self.append_message(agent_response) # Append the assistant's response to the history
-                            tools_result = self.process_tools(agent_response) # process tools requested in agent message
-                            if tools_result: return tools_result, total_tokens, cost #break the execution if the task is done
-=======
                     if self.last_message == agent_response: #if assistant_response is the same as last message in history, let him know
                         await self.append_message(agent_response) # Append the assistant's response to the history
                         warning_msg = self.read_prompt("fw.msg_repeat.md")
                         await self.append_message(warning_msg, human=True) # Append warning message to the history
                         PrintStyle(font_color="orange", padding=True).print(warning_msg)
                         self.context.log.log(type="warning", content=warning_msg)
->>>>>>> 2aedd5fd9d2290f857dfa23f2b5ed656b7e8fe13
 
                     else: #otherwise proceed with tool
                         await self.append_message(agent_response) # Append the assistant's response to the history
@@ -229,6 +256,7 @@ class Agent:
                 except InterventionException as e:
                     pass # intervention message has been handled in handle_intervention(), proceed with conversation loop
                 except asyncio.CancelledError as e:
+                    if self.history_cleanup: self.history_cleanup.cancel()
                     PrintStyle(font_color="white", background_color="red", padding=True).print(f"Context {self.context.id} terminated during message loop")
                     raise e # process cancelled from outside, kill the loop
                 except KillerException as e:
@@ -244,17 +272,69 @@ class Agent:
                     
         finally:
             self.context.streaming_agent = None # unset current streamer
+            if self.memory_recall: self.memory_recall.cancel() # recall would not survive the event loop of this message
+            self.memory_recall = None
 
     def read_prompt(self, file:str, **kwargs):
-        content = ""
+        return files.read_file(self.get_prompt_path(file), **kwargs)
+
+    def get_prompt_path(self, file:str):
+        # the override is looked up on every call, one stat, so a prompt added to prompts_subdir is used from the next message
         if self.config.prompts_subdir:
+            custom = files.get_abs_path(f"./prompts/{self.config.prompts_subdir}/{file}")
             try:
-                content = files.read_file(files.get_abs_path(f"./prompts/{self.config.prompts_subdir}/{file}"), **kwargs)
-            except Exception as e:
+                if os.stat(custom).st_size: return custom # empty prompt falls back to default
+            except OSError:
                 pass
-        if not content:
-            content = files.read_file(files.get_abs_path(f"./prompts/default/{file}"), **kwargs)
-        return content
+        return files.get_abs_path(f"./prompts/default/{file}")
+
+    def get_system_prompt(self):
+        # templates are recompiled only when changed on disk, so their identity tells if the prompt is still valid
+        templates = (files.get_template(self.get_prompt_path("agent.system.md")), files.get_template(self.get_prompt_path("agent.tools.md")))
+        if self._system_prompt_key != templates:
+            self._system_prompt = files.render_template(templates[0], agent_name=self.agent_name) + "\n\n" + files.render_template(templates[1])
+            self._system_prompt_tokens = self.tokenizer.count(self._system_prompt)
+            self._system_prompt_key = templates
+        return self._system_prompt
+
+    def get_prompt_tokens(self, extra_system: str = ""):
+        # system prompt and history are counted once and cached, only the volatile extra part is tokenized here
+        self.get_system_prompt()
+        count = self._system_prompt_tokens + self.get_history_tokens() + tokens.MESSAGE_OVERHEAD
+        if extra_system: count += self.tokenizer.count("\n\n" + extra_system)
+        return count
+
+    def get_cached_prompt_layout(self, system: str, memories: str):
+        # static system prompt and history stay byte-stable at the start so providers can reuse the cached prefix,
+        # volatile memories go to the tail of the last message
+        messages = list(self.history)
+        if memories:
+            if messages and messages[-1].type == "human": messages[-1] = HumanMessage(content=f"{messages[-1].content}\n\n{memories}")
+            else: messages.append(HumanMessage(content=memories))
+
+        provider, _ = tokens.get_model_id(self.config.chat_model)
+        if "Anthropic" not in provider: # openai, google and others cache prefixes automatically
+            return SystemMessage(content=system), messages
+
+        # explicit breakpoints after the system prompt and after the last message that stays unchanged next time
+        system_message = SystemMessage(content=[{"type": "text", "text": system, "cache_control": {"type": "ephemeral"}}])
+        if len(messages) >= 2:
+            stable = messages[-2]
+            messages[-2] = type(stable)(content=[{"type": "text", "text": stable.content, "cache_control": {"type": "ephemeral"}}])
+        return system_message, messages
+
+    def log_cache_usage(self, usage: dict[str, int]):
+        self.total_cached_tokens += usage.get("cache_read", 0)
+        content = f"{usage.get('cache_read', 0)} of {usage.get('input_tokens', '?')} input tokens read from prompt cache, {usage.get('cache_creation', 0)} written"
+        self.context.log.log(type="info", heading=f"{self.agent_name}: Prompt cache", content=content, kvps=usage)
+
+    def get_history_tokens(self):
+        return sum(self.history_tokens) + tokens.MESSAGE_OVERHEAD * len(self.history)
+
+    def get_rate_limiter(self, model):
+        # one limiter per model shared by all agents and contexts, so subordinates count against the same quota
+        provider, name = tokens.get_model_id(model)
+        return rate_limiter.get_limiter(f"{provider}/{name}", max_calls=self.config.rate_limit_requests, max_input_tokens=self.config.rate_limit_input_tokens, max_output_tokens=self.config.rate_limit_output_tokens, window_seconds=self.config.rate_limit_seconds)
 
     def get_data(self, field:str):
         return self.data.get(field, None)
@@ -266,17 +346,21 @@ class Agent:
         message_type = "human" if human else "ai"
         if self.history and self.history[-1].type == message_type:
             self.history[-1].content += "\n\n" + msg
+            self.history_tokens[-1] += self.tokenizer.count("\n\n" + msg)
         else:
             new_message = HumanMessage(content=msg) if human else AIMessage(content=msg)
             self.history.append(new_message)
+            self.history_tokens.append(self.tokenizer.count(msg))
             await self.cleanup_history(self.config.msgs_keep_max, self.config.msgs_keep_start, self.config.msgs_keep_end)
         if message_type=="ai":
             self.last_message = msg
+        else:
+            self.start_memory_recall() # new input for the agent, prepare memories for the next generation
 
     def concat_messages(self,messages):
         return "\n".join([f"{msg.type}: {msg.content}" for msg in messages])
 
-    async def send_adhoc_message(self, system: str, msg: str, output_label:str):
+    async def send_adhoc_message(self, system: str, msg: str, output_label:str, intervene: bool = True):
         prompt = ChatPromptTemplate.from_messages([
             SystemMessage(content=system),
             HumanMessage(content=msg)])
@@ -291,12 +375,22 @@ class Agent:
             printer = PrintStyle(italic=True, font_color="orange", padding=False)
             logger = self.context.log.log(type="adhoc", heading=f"{self.agent_name}: {output_label}:")       
 
-        formatted_inputs = prompt.format()
-        tokens = int(len(formatted_inputs)/4)     
-        self.rate_limiter.limit_call_and_input(tokens)
+        cache_key = None
+        cached = None
+        if self.config.response_cache_enabled and response_cache.is_cacheable(self.config.utility_model):
+            cache_key = response_cache.get_key(self.config.utility_model, system, msg)
+            cached = await asyncio.to_thread(response_cache.get, cache_key, self.config.response_cache_max_age_hours * 3600)
+
+        if cached is not None:
+            stream = response_cache.replay(cached) # no provider call, no rate limit
+        else:
+            input_tokens = self.utility_tokenizer.count(system) + self.utility_tokenizer.count(msg) + 2 * tokens.MESSAGE_OVERHEAD
+            limiter = self.get_rate_limiter(self.config.utility_model)
+            call_record = await limiter.limit_call_and_input(input_tokens, self.context.log)
+            stream = chain.astream({})
     
-        async for chunk in chain.astream({}):
-            if self.handle_intervention(): break # wait for intervention and handle it, if paused
+        async for chunk in stream:
+            if intervene: await self.handle_intervention() # wait for intervention and handle it, if paused
 
             if isinstance(chunk, str): content = chunk
             elif hasattr(chunk, "content"): content = str(chunk.content)
@@ -306,7 +400,10 @@ class Agent:
             response+=content
             if logger: logger.update(content=response)
 
-        self.rate_limiter.set_output_tokens(int(len(response)/4))
+        if cached is None:
+            limiter.set_output_tokens(self.utility_tokenizer.count(response), call_record)
+            if cache_key and response:
+                await asyncio.to_thread(response_cache.put, cache_key, response, self.config.response_cache_max_mb * 1024 * 1024)
 
         return response
             
@@ -316,35 +413,79 @@ class Agent:
 
     async def replace_middle_messages(self,middle_messages):
         cleanup_prompt = self.read_prompt("fw.msg_cleanup.md")
-        summary = await self.send_adhoc_message(system=cleanup_prompt,msg=self.concat_messages(middle_messages), output_label="Mid messages cleanup summary")
+        if middle_messages and middle_messages[0] is self.history_summary:
+            # fold only the new messages into the existing summary
+            msg = f"Previous summary:\n{middle_messages[0].content}\n\nNew messages:\n{self.concat_messages(middle_messages[1:])}"
+        else:
+            msg = self.concat_messages(middle_messages)
+        summary = await self.send_adhoc_message(system=cleanup_prompt, msg=msg, output_label="", intervene=False) # runs in background, no console output
+        self.context.log.log(type="adhoc", heading=f"{self.agent_name}: Mid messages cleanup summary:", content=summary)
         new_human_message = HumanMessage(content=summary)
         return [new_human_message]
 
     async def cleanup_history(self, max:int, keep_start:int, keep_end:int):
-        if len(self.history) <= max:
-            return self.history
+        # summarization of the middle messages runs as a background task and is swapped in when ready
+        self.apply_history_cleanup()
+
+        if len(self.history) >= max and not self.history_cleanup:
+            start, middle_part = self.get_middle_messages(keep_start, keep_end)
+            if middle_part and middle_part != [self.history_summary]:
+                self.history_cleanup = run_in_background(self.summarize_middle_messages(start, middle_part)) # swapped in by a later message if this one ends first
+
+        # summarization is falling behind too much, wait for it
+        if self.history_cleanup and len(self.history) > max + keep_end:
+            await self.finish_history_cleanup()
 
-        first_x = self.history[:keep_start]
-        last_y = self.history[-keep_end:]
+        return self.history
 
-        # Identify the middle part
-        middle_part = self.history[keep_start:-keep_end]
+    def get_middle_messages(self, keep_start:int, keep_end:int):
+        start = keep_start
+        end = len(self.history) - keep_end
 
         # Ensure the first message in the middle is "human", if not, move one message back
-        if middle_part and middle_part[0].type != "human":
-            if len(first_x) > 0:
-                middle_part.insert(0, first_x.pop())
+        if start > 0 and start < end and self.history[start].type != "human":
+            start -= 1
+
+        # Ensure the middle part has an odd number of messages, so it ends with "human" and the summary is followed by "ai"
+        if (end - start) % 2 == 0:
+            end -= 1
 
-        # Ensure the middle part has an odd number of messages
-        if len(middle_part) % 2 == 0:
-            middle_part = middle_part[:-1]
+        return start, self.history[start:end]
 
-        # Replace the middle part using the replacement function
+    async def summarize_middle_messages(self, start:int, middle_part:list):
         new_middle_part = await self.replace_middle_messages(middle_part)
+        return start, middle_part, new_middle_part
 
-        self.history = first_x + new_middle_part + last_y
+    def apply_history_cleanup(self):
+        task = self.history_cleanup
+        if not task or not task.done(): return
+        self.history_cleanup = None
+        if task.cancelled(): return
 
-        return self.history
+        try:
+            start, middle_part, new_middle_part = task.result()
+        except Exception as e:
+            error_message = errors.format_error(e)
+            self.context.log.log(type="error", content=error_message) # history stays as is, next message retries
+            return
+
+        # swap atomically, only if the summarized messages are still where they were
+        end = start + len(middle_part)
+        current = self.history[start:end]
+        if len(current) == len(middle_part) and all(a is b for a, b in zip(current, middle_part)):
+            self.history_summary = new_middle_part[0]
+            self.set_history(self.history[:start] + new_middle_part + self.history[end:])
+
+    async def finish_history_cleanup(self):
+        if self.history_cleanup and not self.history_cleanup.done():
+            await asyncio.wait([asyncio.wrap_future(self.history_cleanup)])
+        self.apply_history_cleanup()
+
+    def set_history(self, history: list):
+        # reuse cached token counts of messages that were kept, count only the new ones
+        known = {id(msg): count for msg, count in zip(self.history, self.history_tokens)}
+        self.history_tokens = [known[id(msg)] if id(msg) in known else self.tokenizer.count(msg.content) for msg in history]
+        self.history = history
 
     async def handle_intervention(self, progress:str=""):
         while self.context.paused: await asyncio.sleep(0.1) # wait if paused
@@ -357,43 +498,49 @@ class Agent:
             raise InterventionException(msg)
 
     async def process_tools(self, msg: str):
-        # search for tool usage requests in agent message
-        tool_request = extract_tools.json_parse_dirty(msg)
+        # search for tool usage requests in agent message, one or more in "tool_calls"
+        tool_requests = extract_tools.json_parse_tool_requests(msg)
 
-        if tool_request is not None:
-            tool_name = tool_request.get("tool_name", "")
-            tool_args = tool_request.get("tool_args", {})
-            tool = self.get_tool(tool_name, tool_args, msg)
-                
-            await self.handle_intervention() # wait if paused and handle intervention message if needed
-            await tool.before_execution(**tool_args)
-            await self.handle_intervention() # wait if paused and handle intervention message if needed
-            response = await tool.execute(**tool_args)
-            await self.handle_intervention() # wait if paused and handle intervention message if needed
-            await tool.after_execution(response)
-            await self.handle_intervention() # wait if paused and handle intervention message if needed
-            if response.break_loop: return response.message
+        if tool_requests is not None:
+            tools = [self.get_tool(request.get("tool_name", ""), request.get("tool_args", {}), msg) for request in tool_requests]
+
+            # consecutive concurrent tools run together, others one by one in the requested order
+            batches: list[list] = []
+            for tool in tools:
+                if batches and tool.concurrent and batches[-1][-1].concurrent: batches[-1].append(tool)
+                else: batches.append([tool])
+
+            for batch in batches:
+                result = await self.execute_tools(batch)
+                if result is not None: return result
         else:
             msg = self.read_prompt("fw.msg_misformat.md")
             await self.append_message(msg, human=True)
             PrintStyle(font_color="red", padding=True).print(msg)
             self.context.log.log(type="error", content=f"{self.agent_name}: Message misformat:")
 
+    async def execute_tools(self, tools: list):
+        await self.handle_intervention() # wait if paused and handle intervention message if needed
+        for tool in tools: await tool.before_execution(**tool.args)
+        await self.handle_intervention() # wait if paused and handle intervention message if needed
+        tasks = [asyncio.create_task(tool.execute(**tool.args)) for tool in tools]
+        try:
+            responses = await asyncio.gather(*tasks)
+        except BaseException:
+            # one tool failed or was intervened, the others are stopped instead of running on unobserved
+            for task in tasks: task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        await self.handle_intervention() # wait if paused and handle intervention message if needed
+        for tool, response in zip(tools, responses): await tool.after_execution(response) # responses are merged into one message in history
+        await self.handle_intervention() # wait if paused and handle intervention message if needed
+        for response in responses:
+            if response.break_loop: return response.message
 
     def get_tool(self, name: str, args: dict, message: str, **kwargs):
         from python.tools.unknown import Unknown 
-        from python.helpers.tool import Tool
         
-        tool_class = Unknown
-        if files.exists("python/tools",f"{name}.py"): 
-            module = importlib.import_module("python.tools." + name)  # Import the module
-            class_list = inspect.getmembers(module, inspect.isclass)  # Get all functions in the module
-
-            for cls in class_list:
-                if cls[1] is not Tool and issubclass(cls[1], Tool):
-                    tool_class = cls[1]
-                    break
-
+        tool_class = tool_registry.get(name, self.context.log) or Unknown
         return tool_class(agent=self, name=name, args=args, message=message, **kwargs)
 
     async def fetch_memories(self,reset_skip=False):
@@ -405,22 +552,44 @@ class Agent:
             return ""
         else:
             self.memory_skip_counter = self.config.auto_memory_skip
-            from python.tools import memory_tool
-            messages = self.concat_messages(self.history)
-            memories = memory_tool.search(self,messages)
+            if not self.memory_recall: self.start_memory_recall()
+            recall, self.memory_recall = self.memory_recall, None
+            return await recall # type: ignore
+
+    def start_memory_recall(self):
+        # recall runs as a task from the moment new input lands, concurrently with the rest of the iteration
+        if self.config.auto_memory_count<=0 or self.memory_skip_counter > 0: return
+        if self.memory_recall: self.memory_recall.cancel() # history changed, previous recall is outdated
+        self.memory_recall = asyncio.create_task(self.recall_memories(list(self.history[-self.config.msgs_keep_end:])))
+
+    async def recall_memories(self, recent_history: list):
+        from python.tools import memory_tool
+        messages = self.concat_messages(recent_history)
+
+        # same recent history and unchanged memory store, reuse last result
+        version = await asyncio.to_thread(memory_tool.get_version, self) # first use loads the store
+        history_key = hashlib.md5(f"{version}\n{messages}".encode()).hexdigest()
+        cached = self.memory_cache.get("history")
+        if cached and cached[0] == history_key: return cached[1]
+
+        docs = await asyncio.to_thread(memory_tool.search_documents, self, messages, self.config.auto_memory_count)
+        if not docs:
+            clean_memories = ""
+        else:
             input = {
                 "conversation_history" : messages,
-                "raw_memories": memories
+                "raw_memories": str(docs)
             }
             cleanup_prompt = self.read_prompt("msg.memory_cleanup.md").replace("{", "{{")       
-            clean_memories = await self.send_adhoc_message(cleanup_prompt,json.dumps(input), output_label="Memory injection")
-            return clean_memories
+            clean_memories = await self.send_adhoc_message(cleanup_prompt,json.dumps(input), output_label="Memory injection", intervene=False)
+
+        self.memory_cache["history"] = (history_key, clean_memories)
+        return clean_memories
 
-    def log_from_stream(self, stream: str, logItem: Log.LogItem):
+    def log_from_stream(self, stream: str, chunk: str, parser: DirtyJson, logItem: Log.LogItem):
         try:
-            if len(stream) < 25: return # no reason to try
-            response = DirtyJson.parse_string(stream)
-            if isinstance(response, dict): logItem.update(content=stream, kvps=response) #log if result is a dictionary already
+            response = parser.feed(chunk) # only the new chunk is parsed, partial values are kept in the parser
+            if isinstance(response, dict): logItem.update(content=stream, kvps=copy_containers(response)) #log if result is a dictionary already
         except Exception as e:
             pass
 
@@ -0,0 +1,89 @@
+# Insert throughput, search latency and load time of the memory store backends on a synthetic corpus.
+# Run from the repository root: python -m benchmarks.backends [vector count]
+# Embeddings are precomputed synthetic vectors, so the numbers measure the stores and not an embeddings provider.
+import os, shutil, sys, time
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from python.helpers import files, vector_store
+from benchmarks.vector_index import synthetic
+
+QUERIES = 200
+BATCH = 1000 # documents per insert call
+BATCH_QUERIES = 20 # queries per batch search call
+RESULTS = 10
+DIR = "tmp/benchmark_backends"
+
+# backend and constructor options
+CONFIGS = [
+    ("faiss", {}),
+    ("faiss", {"index_type": "hnsw", "index_promote_at": 0}),
+    ("faiss", {"quantization": "sq8", "index_promote_at": 0}),
+    ("chroma", {}),
+]
+
+class SyntheticEmbeddings(Embeddings):
+    model = "synthetic"
+
+    def __init__(self, vectors: dict[str, list[float]]):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return [self.vectors.get(text) or self.vectors["example text"] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+class Logger:
+    def log(self, *args, **kwargs):
+        pass
+
+def main():
+    count = int(sys.argv[-1]) if sys.argv[-1].isdigit() else 20_000
+    vectors = synthetic(count + QUERIES)
+    texts = [f"document {i}" for i in range(count)]
+    queries = [f"query {i}" for i in range(QUERIES)]
+    model = SyntheticEmbeddings(dict(zip(texts + queries, vectors.tolist())) | {"example text": vectors[0].tolist()})
+    print(f"{count} documents, {vectors.shape[1]} dimensions, {QUERIES} queries, {RESULTS} results\n")
+
+    print(f"{'backend':<20} {'insert/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'batch q/s':>10} {'load s':>8}")
+    for backend, options in CONFIGS:
+        try:
+            store = vector_store.get_backend(backend)
+        except ImportError as e:
+            print(f"{backend:<20} skipped, {e}")
+            continue
+        name = backend + "".join(f" {value}" for key, value in options.items() if key != "index_promote_at")
+        shutil.rmtree(files.get_abs_path(DIR), ignore_errors=True)
+
+        # embeddings cache in memory, the corpus is embedded by the synthetic model in every run
+        db = store(Logger(), model, in_memory=True, memory_dir=DIR, knowledge_dir="", **options)
+        start = time.perf_counter()
+        for first in range(0, count, BATCH):
+            db.insert_documents([Document(text, metadata={"area": "main"}) for text in texts[first:first + BATCH]])
+        db.flush()
+        inserts = count / (time.perf_counter() - start)
+
+        for query in queries: db.embedder.embed_query(query) # type: ignore # query embeddings cached, only the search is timed
+        latencies = []
+        for query in queries:
+            start = time.perf_counter()
+            db.search_similarity_threshold(query, RESULTS, threshold=-10)
+            latencies.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        for first in range(0, QUERIES, BATCH_QUERIES):
+            db.search_batch(queries[first:first + BATCH_QUERIES], RESULTS, threshold=-10)
+        batch = QUERIES / (time.perf_counter() - start)
+        db.close()
+
+        start = time.perf_counter()
+        db = store(Logger(), model, in_memory=True, memory_dir=DIR, knowledge_dir="", **options)
+        db.search_similarity_threshold(queries[0], RESULTS, threshold=-10) # first search, mapped or lazily loaded data is read
+        load = time.perf_counter() - start
+        db.close()
+
+        print(f"{name:<20} {inserts:>9.0f} {np.percentile(latencies, 50):>9.3f} {np.percentile(latencies, 99):>9.3f} {batch:>10.0f} {load:>8.2f}")
+    shutil.rmtree(files.get_abs_path(DIR), ignore_errors=True)
+
+if __name__ == "__main__":
+    main()
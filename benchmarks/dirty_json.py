@@ -0,0 +1,47 @@
+# Parse throughput of DirtyJson on large tool requests.
+# Run from the repository root: python -m benchmarks.dirty_json
+import json, time
+from python.helpers.dirty_json import DirtyJson
+
+def make_payload(lines: int) -> dict:
+    code = "\n".join(f"def func_{i}(x):\n    return {{'value': x * {i}, \"text\": 'line {i}'}}  # comment {i}" for i in range(lines))
+    return {
+        "thoughts": ["I will write the module.", "Then I will run it."],
+        "tool_name": "code_execution_tool",
+        "tool_args": {"runtime": "python", "code": code},
+    }
+
+def dirty(payload: dict) -> str:
+    # same payload the way models tend to break it: unquoted keys, triple quoted code, no closing braces
+    code = payload["tool_args"]["code"]
+    return ("Here is my response:\n{thoughts: [\"I will write the module.\", 'Then I will run it.'],\n"
+            "tool_name: code_execution_tool,\ntool_args: {runtime: python, code: \"\"\"\n" + code + "\n\"\"\"")
+
+def measure(name: str, text: str, func, repeat: int):
+    func() # warm up
+    start = time.perf_counter()
+    for _ in range(repeat): func()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f"{name:<28} {len(text)/1024:>8.1f} KB {elapsed*1000:>9.3f} ms {len(text)/elapsed/1024/1024:>9.1f} MB/s")
+
+def stream(text: str, chunk: int):
+    parser = DirtyJson()
+    for i in range(0, len(text), chunk):
+        parser.feed(text[i:i + chunk])
+    return parser.finish()
+
+def main():
+    for lines in [50, 500, 5000]:
+        payload = make_payload(lines)
+        strict = json.dumps(payload, indent=4)
+        broken = dirty(payload)
+        assert DirtyJson.parse_string(strict) == payload
+        assert DirtyJson.parse_string(broken)["tool_args"]["code"] == payload["tool_args"]["code"] # type: ignore
+        repeat = max(1, 2000 // lines)
+        measure(f"strict ({lines} lines)", strict, lambda: DirtyJson.parse_string(strict), repeat)
+        measure(f"dirty ({lines} lines)", broken, lambda: DirtyJson.parse_string(broken), repeat)
+        measure(f"stream 16B ({lines} lines)", strict, lambda: stream(strict, 16), max(1, repeat // 4))
+        print()
+
+if __name__ == "__main__":
+    main()
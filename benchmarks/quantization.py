@@ -0,0 +1,45 @@
+# Memory and recall of quantized VectorDB indexes against the exact flat index, with and without re-ranking.
+# Run from the repository root: python -m benchmarks.quantization [memory/database dir] [vector count]
+# Re-ranking fetches RERANK_FACTOR * k candidates and orders them by the distance of the full vectors, as VectorDB does.
+import sys, time
+import numpy as np
+from python.helpers import vector_index
+from benchmarks.vector_index import synthetic, load
+
+K = 10
+QUERIES = 200
+INDEX_TYPES = ["flat", "hnsw", "ivf"]
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else ""
+    count = int(sys.argv[-1]) if sys.argv[-1].isdigit() else 50_000
+    vectors = load(source) if source else synthetic(count)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), QUERIES, replace=False)] + rng.normal(scale=0.05, size=(QUERIES, vectors.shape[1])).astype(np.float32)
+    print(f"{len(vectors)} vectors, {vectors.shape[1]} dimensions, {QUERIES} queries, recall@{K}, re-ranking {vector_index.RERANK_FACTOR * K} candidates\n")
+
+    exact = [set(ids) for ids in vector_index.build("flat", vectors).search(queries, K)[1]]
+    print(f"{'index':<12} {'size MB':>9} {'ratio':>7} {'recall':>8} {'reranked':>9} {'p50 ms':>9}")
+    baseline = 0
+    for index_type in INDEX_TYPES:
+        for quantization in vector_index.QUANTIZATIONS:
+            if len(vectors) < vector_index.min_vectors(index_type, quantization): continue
+            index = vector_index.build(index_type, vectors, quantization)
+            size = vector_index.get_memory_size(index) / 1024 / 1024
+            if not baseline: baseline = size # flat without quantization is first
+
+            _, found = index.search(queries, K)
+            recall = np.mean([len(set(ids) & truth) / K for ids, truth in zip(found, exact)])
+            latencies = []
+            reranked = []
+            for query, truth in zip(queries, exact):
+                start = time.perf_counter()
+                _, candidates = index.search(query.reshape(1, -1), K * vector_index.RERANK_FACTOR)
+                candidates = candidates[0][candidates[0] >= 0]
+                ids = candidates[np.argsort(vector_index.get_distances(query, vectors[candidates]))[:K]]
+                latencies.append((time.perf_counter() - start) * 1000)
+                reranked.append(len(set(ids) & truth) / K)
+            print(f"{index_type + '/' + quantization:<12} {size:>9.1f} {baseline / size:>6.1f}x {recall:>8.3f} {np.mean(reranked):>9.3f} {np.percentile(latencies, 50):>9.3f}")
+
+if __name__ == "__main__":
+    main()
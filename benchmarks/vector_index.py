@@ -0,0 +1,57 @@
+# Recall and latency of the VectorDB index types against the exact flat index.
+# Run from the repository root: python -m benchmarks.vector_index [memory/database dir] [vector count]
+# Without a directory a synthetic clustered corpus is used, with one the vectors of that store are compared.
+import os, pickle, sys, time
+import faiss
+import numpy as np
+from python.helpers import vector_index
+
+K = 10
+QUERIES = 200
+
+def synthetic(count: int, dimensions: int = 384, clusters: int = 200) -> np.ndarray:
+    # embeddings are clustered by topic, uniform random vectors would make every index look bad
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(clusters, dimensions))
+    vectors = centers[rng.integers(0, clusters, count)] + rng.normal(scale=0.6, size=(count, dimensions))
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors.astype(np.float32)
+
+def load(db_dir: str) -> np.ndarray:
+    # vectors of the stored documents, deleted ones may still be in an hnsw graph
+    index = vector_index.load(os.path.join(db_dir, "index.faiss"), mmap=False)
+    with open(os.path.join(db_dir, "index.ids"), "rb") as f:
+        ids = pickle.load(f)
+    labels = sorted(ids) if isinstance(ids, dict) else range(len(ids))
+    return vector_index.get_vectors(index, np.array(labels, dtype=np.int64))
+
+def main():
+    source = sys.argv[1] if len(sys.argv) > 1 and not sys.argv[1].isdigit() else ""
+    count = int(sys.argv[-1]) if sys.argv[-1].isdigit() else 100_000
+    vectors = load(source) if source else synthetic(count)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.choice(len(vectors), QUERIES, replace=False)] + rng.normal(scale=0.05, size=(QUERIES, vectors.shape[1])).astype(np.float32)
+    print(f"{len(vectors)} vectors, {vectors.shape[1]} dimensions, {QUERIES} queries, recall@{K}\n")
+
+    exact = None
+    print(f"{'index':<8} {'build s':>9} {'size MB':>9} {'p50 ms':>9} {'p99 ms':>9} {'recall':>8}")
+    for index_type in vector_index.INDEX_TYPES:
+        if len(vectors) < vector_index.min_vectors(index_type): continue
+        start = time.perf_counter()
+        index = vector_index.build(index_type, vectors)
+        build = time.perf_counter() - start
+        size = len(faiss.serialize_index(index)) / 1024 / 1024
+
+        latencies = []
+        results = []
+        for query in queries:
+            start = time.perf_counter()
+            _, ids = index.search(query.reshape(1, -1), K)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append(ids[0])
+        if exact is None: exact = results # flat is first and exact
+        recall = np.mean([len(set(a) & set(b)) / K for a, b in zip(results, exact)])
+        print(f"{index_type:<8} {build:>9.2f} {size:>9.1f} {np.percentile(latencies, 50):>9.3f} {np.percentile(latencies, 99):>9.3f} {recall:>8.3f}")
+
+if __name__ == "__main__":
+    main()
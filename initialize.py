@@ -29,12 +29,26 @@ def initialize():
         # prompts_subdir = "",
         # memory_subdir = "",
         # knowledge_subdir: str = ""
+        # memory_backend = "faiss",
+        # memory_index_type = "flat",
+        # memory_index_promote_at = 10000,
+        # memory_quantization = "none",
+        # memory_cache_max_mb = 0,
+        # memory_cache_idle_seconds = 3600,
+        # memory_search_mode = "vector",
+        # memory_dedup_threshold = 0,
+        # memory_dedup_action = "skip",
+        # memory_consolidate_every = 0,
         auto_memory_count = 0,
         # auto_memory_skip = 2,
         # rate_limit_seconds = 60,
         rate_limit_requests = 15,
         # rate_limit_input_tokens = 0,
         # rate_limit_output_tokens = 0,
+        # prompt_caching = False,
+        # response_cache_enabled = False,
+        # response_cache_max_mb = 100,
+        # response_cache_max_age_hours = 168,
         # msgs_keep_max = 25,
         # msgs_keep_start = 5,
         # msgs_keep_end = 10,
@@ -48,7 +48,7 @@ def get_anthropic_chat(model_name:str, api_key=None, temperature=DEFAULT_TEMPERA
 # OpenAI models
 def get_openai_chat(model_name:str, api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("openai")
-    return ChatOpenAI(model_name=model_name, temperature=temperature, api_key=api_key) # type: ignore
+    return ChatOpenAI(model_name=model_name, temperature=temperature, api_key=api_key, stream_usage=True) # type: ignore
 
 def get_openai_instruct(model_name:str,api_key=None, temperature=DEFAULT_TEMPERATURE):
     api_key = api_key or get_api_key("openai")
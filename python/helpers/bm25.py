@@ -0,0 +1,78 @@
+import heapq, math, re
+from collections import Counter
+
+K1 = 1.5
+B = 0.75
+RRF_K = 60 # rank constant of reciprocal rank fusion
+POSTING_BYTES = 30 # approximate python memory of a term frequency entry, measured with tracemalloc
+TERM_BYTES = 150 # term string and its postings dict
+
+_words = re.compile(r"\w+")
+_compounds = re.compile(r"\w+(?:[./\-:]+\w+)+") # file names, paths, dotted names, error codes
+_keyword = re.compile(r"\d|_|[./\-:]\w|[a-z][A-Z]|^[A-Z]{3,}$")
+
+def tokenize(text: str) -> list[str]:
+    # words plus whole compound identifiers, so "config.py" matches both the file name and "config"
+    text_lower = text.lower()
+    return _words.findall(text_lower) + _compounds.findall(text_lower)
+
+def is_keyword_query(query: str) -> bool:
+    # short queries made of identifiers, file names or error strings, quoted queries are taken literally
+    query = query.strip()
+    if len(query) > 1 and query[0] == query[-1] and query[0] in "\"'`": return True
+    words = query.split()
+    return 0 < len(words) <= 3 and any(_keyword.search(word) for word in words)
+
+class BM25Index:
+    # inverted index of document ids, updated together with the vector index
+    def __init__(self):
+        self.postings: dict[str, dict[str, int]] = {} # term -> id -> term frequency
+        self.lengths: dict[str, int] = {} # id -> token count
+        self.total_length = 0
+        self.entries = 0 # term frequency entries in all postings
+
+    def add(self, id: str, text: str):
+        if id in self.lengths: self.remove(id)
+        tokens = tokenize(text)
+        for term, count in Counter(tokens).items():
+            self.postings.setdefault(term, {})[id] = count
+            self.entries += 1
+        self.lengths[id] = len(tokens)
+        self.total_length += len(tokens)
+
+    def remove(self, id: str, text: str | None = None):
+        length = self.lengths.pop(id, None)
+        if length is None: return
+        self.total_length -= length
+        terms = set(tokenize(text)) if text is not None else list(self.postings)
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs and docs.pop(id, None) is not None:
+                self.entries -= 1
+                if not docs: del self.postings[term]
+
+    def search(self, query: str, count: int, allowed: set[str] | None = None) -> list[tuple[str, float]]:
+        if not self.lengths: return []
+        docs_count = len(self.lengths)
+        average = self.total_length / docs_count or 1
+        scores: dict[str, float] = {}
+        for term in set(tokenize(query.strip("\"'`"))):
+            docs = self.postings.get(term)
+            if not docs: continue
+            idf = math.log(1 + (docs_count - len(docs) + 0.5) / (len(docs) + 0.5))
+            for id, frequency in docs.items():
+                if allowed is not None and id not in allowed: continue
+                norm = frequency + K1 * (1 - B + B * self.lengths[id] / average)
+                scores[id] = scores.get(id, 0) + idf * frequency * (K1 + 1) / norm
+        return heapq.nlargest(count, scores.items(), key=lambda item: item[1])
+
+    def get_memory_size(self) -> int:
+        return self.entries * POSTING_BYTES + len(self.postings) * TERM_BYTES + len(self.lengths) * POSTING_BYTES
+
+def fuse(*rankings: list[str], count: int) -> list[str]:
+    # reciprocal rank fusion of id rankings
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, id in enumerate(ranking):
+            scores[id] = scores.get(id, 0) + 1 / (RRF_K + rank + 1)
+    return heapq.nlargest(count, scores, key=lambda id: scores[id])
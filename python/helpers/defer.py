@@ -2,6 +2,18 @@ import asyncio
 import threading
 from concurrent.futures import Future
 
+_background_loop: asyncio.AbstractEventLoop | None = None
+_background_lock = threading.Lock()
+
+def run_in_background(coro) -> Future:
+    # housekeeping that outlives the event loop of a single message runs on one shared loop thread
+    global _background_loop
+    with _background_lock:
+        if not _background_loop:
+            _background_loop = asyncio.new_event_loop()
+            threading.Thread(target=_background_loop.run_forever, daemon=True).start()
+    return asyncio.run_coroutine_threadsafe(coro, _background_loop)
+
 class DeferredTask:
     def __init__(self, func, *args, **kwargs):
         self._loop = asyncio.new_event_loop()
@@ -1,264 +1,350 @@
+import json, re
+
+# what the innermost open container expects next
+KEY, COLON, VALUE, COMMA = range(4)
+
+_whitespace = re.compile(r'\s*')
+_unquoted_key = re.compile(r'[^\s:,}\]]+')
+_unquoted_end = re.compile(r'[,}\]]')
+_number = re.compile(r'[-+0-9.eE]+')
+_string_stops = {q: re.compile(r'[\\' + q + ']') for q in ['"', "'", "`"]}
+_escapes = {'"': '"', "'": "'", '`': '`', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+_decoder = json.JSONDecoder()
+_literals = [("true", True), ("false", False), ("null", None), ("undefined", None)]
+PUBLISH_GROWTH = 8 # partial strings are published after growing by 1/8 of their published length
+
+def copy_containers(value):
+    # copy of the dicts and lists of a result with the strings shared, safe to read while the parser continues
+    if isinstance(value, dict): return {key: copy_containers(item) for key, item in value.items()}
+    if isinstance(value, list): return [copy_containers(item) for item in value]
+    return value
+
+class _Frame:
+    __slots__ = ("container", "key", "expect", "doubled")
+
+    def __init__(self, container, expect, doubled=False):
+        self.container = container
+        self.key = None
+        self.expect = expect
+        self.doubled = doubled # opened with {{, closes with }}
+
+class _String:
+    __slots__ = ("quote", "triple", "parts", "slot", "is_key", "published", "pending", "checked")
+
+    def __init__(self, quote, triple=False, slot=None, is_key=False):
+        self.quote = quote # None for unquoted values
+        self.triple = triple
+        self.parts: list[str] = []
+        self.slot = slot # (container, key or index) the value is written to
+        self.is_key = is_key
+        self.published = 0 # length of the value last made visible in the result
+        self.pending = 0 # characters parsed since then
+        self.checked = 0 # parts counted in pending
+
 class DirtyJson:
     def __init__(self):
         self._reset()
 
     def _reset(self):
-        self.json_string = ""
+        self.json_string = "" # input not processed yet
         self.index = 0
-        self.current_char = None
         self.result = None
-        self.stack = []
+        self.stack: list[_Frame] = []
+        self.string: _String | None = None # string being parsed, kept between chunks
+        self.done = False
 
     @staticmethod
     def parse_string(json_string):
         parser = DirtyJson()
         return parser.parse(json_string)
-    
+
     def parse(self, json_string):
         self._reset()
+        start = json_string.find("{") # skip any text up to the first brace
+        if start == -1: return None
+
+        # strict fast path, valid JSON is decoded by the C scanner
+        try:
+            result, _ = _decoder.raw_decode(json_string, start)
+            if isinstance(result, dict):
+                self.result = result
+                self.done = True
+                return result
+        except ValueError:
+            pass
+
         self.json_string = json_string
-        self.index = self.index_of_first_brace(self.json_string) #skip any text up to the first brace
-        self.current_char = self.json_string[self.index]
-        self._parse()
-        return self.result
-        
+        self.index = start
+        return self.finish()
+
     def feed(self, chunk):
-        self.json_string += chunk
-        if not self.current_char and self.json_string:
-            self.current_char = self.json_string[0]
-        self._parse()
+        # resumable parsing, only the new part of the input is processed
+        if self.done: return self.result
+        self.json_string = self.json_string[self.index:] + chunk
+        self.index = 0
+        self._parse(final=False)
+        self._publish_partial()
         return self.result
 
-    def _advance(self, count=1):
-        self.index += count
-        if self.index < len(self.json_string):
-            self.current_char = self.json_string[self.index]
-        else:
-            self.current_char = None
-
-    def _skip_whitespace(self):
-        while self.current_char is not None and self.current_char.isspace():
-            self._advance()
-
-    def _parse(self):
-        if self.result is None:
-            self.result = self._parse_value()
-        else:
-            self._continue_parsing()
+    def finish(self):
+        # end of input, close whatever is still open
+        if not self.done:
+            self._parse(final=True)
+            if self.stack:
+                frame = self.stack[-1]
+                if isinstance(frame.container, dict) and frame.key is not None and frame.expect in (COLON, VALUE):
+                    frame.container[frame.key] = None # key without value
+            self.stack = []
+            self.done = True
+        return self.result
 
-    def _continue_parsing(self):
-        while self.current_char is not None:
-            if isinstance(self.result, dict):
-                self._parse_object_content()
-            elif isinstance(self.result, list):
-                self._parse_array_content()
-            elif isinstance(self.result, str):
-                self.result = self._parse_string()
-            else:
-                break
+    def _parse(self, final):
+        s = self.json_string
+        while not self.done:
+            if self.string:
+                if not self._parse_string_content(final): return
+                continue
 
-    def _parse_value(self):
-        self._skip_whitespace()
-        if self.current_char == '{':
-            if self._peek(1) == '{':  # Handle {{
-                self._advance(2)
-            return self._parse_object()
-        elif self.current_char == '[':
-            return self._parse_array()
-        elif self.current_char in ['"', "'", "`"]:
-            if self._peek(2) == self.current_char * 2:  # type: ignore
-                return self._parse_multiline_string()
-            return self._parse_string()
-        elif self.current_char and (self.current_char.isdigit() or self.current_char in ['-', '+']):
-            return self._parse_number()
-        elif self._match("true"):
-            return True
-        elif self._match('false'):
-            return False
-        elif self._match('null') or self._match("undefined"):
-            return None
-        elif self.current_char:
-            return self._parse_unquoted_string()
-        return None
+            if not self.stack: # skip any text up to the first brace
+                start = s.find("{", self.index)
+                if start == -1:
+                    self.index = len(s)
+                    return
+                self.index = start
+                if not self._start_value(final): return
+                continue
 
-    def _match(self, text: str) -> bool:
-        cnt = len(text)
-        if self._peek(cnt).lower() == text.lower():
-            self._advance(cnt)
-            return True
-        return False
-    
-    def _parse_object(self):
-        obj = {}
-        self._advance()  # Skip opening brace
-        self.stack.append(obj)
-        self._parse_object_content()
-        return obj
+            self.index = _whitespace.match(s, self.index).end()
+            if self.index >= len(s): return
+            char = s[self.index]
+            frame = self.stack[-1]
 
-    def _parse_object_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
-            if self.current_char == '}':
-                if self._peek(1) == '}':  # Handle }}
-                    self._advance(2)
+            if isinstance(frame.container, dict):
+                if frame.expect == KEY:
+                    if char == '}':
+                        if not self._close(final): return
+                    elif char in ',:]':
+                        self.index += 1 # stray separator
+                    elif char in ['"', "'"]:
+                        self.string = _String(char, is_key=True)
+                        self.index += 1
+                    else:
+                        match = _unquoted_key.match(s, self.index)
+                        if match.end() == len(s) and not final: return
+                        frame.key = match.group()
+                        frame.expect = COLON
+                        self.index = match.end()
+                elif frame.expect == COLON:
+                    if char == ':':
+                        self.index += 1
+                        frame.expect = VALUE
+                    elif char in ',}':
+                        self._put(None)
+                    else:
+                        frame.expect = VALUE # missing colon
+                elif frame.expect == VALUE:
+                    if char in ',}':
+                        self._put(None)
+                    elif not self._start_value(final): return
                 else:
-                    self._advance()
-                self.stack.pop()
-                return
-            if self.current_char is None:
-                self.stack.pop()
-                return  # End of input reached while parsing object
-            
-            key = self._parse_key()
-            value = None
-            self._skip_whitespace()
-            
-            if self.current_char == ':':
-                self._advance()
-                value = self._parse_value()
-            elif self.current_char is None:
-                value = None  # End of input reached after key
+                    if char == ',':
+                        self.index += 1
+                        frame.expect = KEY
+                    elif char == '}':
+                        if not self._close(final): return
+                    else:
+                        frame.expect = KEY # missing comma
             else:
-                value = self._parse_value()
-                
-            self.stack[-1][key] = value
-            
-            self._skip_whitespace()
-            if self.current_char == ',':
-                self._advance()
-                continue
-            elif self.current_char != '}':
-                if self.current_char is None:
-                    self.stack.pop()
-                    return  # End of input reached after value
-                continue
+                if frame.expect == VALUE:
+                    if char == ']':
+                        self._close(final)
+                    elif char == ',':
+                        self.index += 1
+                    elif not self._start_value(final): return
+                else:
+                    if char == ',':
+                        self.index += 1
+                        frame.expect = VALUE
+                    elif char == ']':
+                        self._close(final)
+                    elif char == '}':
+                        self._pop() # unclosed array, leave the brace to the parent object
+                    else:
+                        frame.expect = VALUE # missing comma
 
-    def _parse_key(self):
-        self._skip_whitespace()
-        if self.current_char in ['"', "'"]:
-            return self._parse_string()
+    def _start_value(self, final) -> bool:
+        # returns False when more input is needed to decide
+        s = self.json_string
+        i = self.index
+        char = s[i]
+        if char == '{':
+            if i + 1 >= len(s) and not final: return False
+            doubled = s.startswith("{", i + 1) # handle {{
+            obj = {}
+            self._push(obj, KEY, doubled)
+            self.index += 2 if doubled else 1
+        elif char == '[':
+            arr = []
+            self._push(arr, VALUE)
+            self.index += 1
+        elif char in ['"', "'", "`"]:
+            if len(s) - i < 3 and not final: return False
+            triple = s.startswith(char * 3, i)
+            self.string = _String(char, triple, slot=self._put(""))
+            self.index += 3 if triple else 1
+        elif char.isdigit() or char in ['-', '+']:
+            match = _number.match(s, i)
+            if match.end() == len(s) and not final: return False
+            self._put(self._to_number(match.group()))
+            self.index = match.end()
         else:
-            return self._parse_unquoted_key()
+            for word, value in _literals:
+                head = s[i:i + len(word)].lower()
+                end = i + len(word)
+                if head == word:
+                    if end == len(s) and not final: return False
+                    if end < len(s) and (s[end].isalnum() or s[end] == '_'): break # longer unquoted word
+                    self._put(value)
+                    self.index = end
+                    return True
+                if len(head) < len(word) and word.startswith(head) and not final: return False
+            self.string = _String(None, slot=self._put(""))
+        return True
 
-    def _parse_unquoted_key(self):
-        result = ""
-        while self.current_char is not None and not self.current_char.isspace() and self.current_char not in [':', ',', '}', ']']:
-            result += self.current_char
-            self._advance()
-        return result
+    def _parse_string_content(self, final) -> bool:
+        # returns False when the string continues in the next chunk
+        string = self.string
+        assert string
+        s = self.json_string
+        i = self.index
 
-    def _parse_array(self):
-        arr = []
-        self._advance()  # Skip opening bracket
-        self.stack.append(arr)
-        self._parse_array_content()
-        return arr
+        if string.quote is None: # unquoted value runs up to the next separator
+            match = _unquoted_end.search(s, i)
+            end = match.start() if match else len(s)
+            string.parts.append(s[i:end])
+            self.index = end
+            if match or final: self._end_string()
+            return bool(match) or final
 
-    def _parse_array_content(self):
-        while self.current_char is not None:
-            self._skip_whitespace()
-            if self.current_char == ']':
-                self._advance()
-                self.stack.pop()
-                return
-            value = self._parse_value()
-            self.stack[-1].append(value)
-            self._skip_whitespace()
-            if self.current_char == ',':
-                self._advance()
-            elif self.current_char != ']':
-                self.stack.pop()
-                return
+        if string.triple:
+            end = s.find(string.quote * 3, i)
+            if end == -1:
+                keep = len(s) if final else max(i, len(s) - 2) # closing quotes may be split between chunks
+                string.parts.append(s[i:keep])
+                self.index = keep
+                if final: self._end_string()
+                return final
+            string.parts.append(s[i:end])
+            self.index = end + 3
+            self._end_string()
+            return True
 
-    def _parse_string(self):
-        result = ""
-        quote_char = self.current_char
-        self._advance()  # Skip opening quote
-        while self.current_char is not None and self.current_char != quote_char:
-            if self.current_char == '\\':
-                self._advance()
-                if self.current_char in ['"', "'", '\\', '/', 'b', 'f', 'n', 'r', 't']:
-                    result += {'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}.get(self.current_char, self.current_char)
-                elif self.current_char == 'u':
-                    unicode_char = ""
-                    for _ in range(4):
-                        if self.current_char is None:
-                            return result
-                        unicode_char += self.current_char
-                        self._advance()
-                    result += chr(int(unicode_char, 16))
-                    continue
+        stops = _string_stops[string.quote]
+        while True:
+            match = stops.search(s, i)
+            if not match:
+                string.parts.append(s[i:])
+                self.index = len(s)
+                if final: self._end_string()
+                return final
+            string.parts.append(s[i:match.start()])
+            i = match.start()
+            if s[i] == string.quote:
+                self.index = i + 1
+                self._end_string()
+                return True
+            if i + 1 >= len(s): # escape split between chunks
+                self.index = len(s) if final else i
+                if final: self._end_string()
+                return final
+            escaped = s[i + 1]
+            if escaped == 'u':
+                code = s[i + 2:i + 6]
+                if len(code) < 4 and not final:
+                    self.index = i
+                    return False
+                try:
+                    char = int(code, 16)
+                    i += 6
+                    if 0xD800 <= char <= 0xDBFF: # surrogate pair
+                        if len(s) - i < 6 and not final:
+                            self.index = i - 6
+                            return False
+                        if s.startswith("\\u", i):
+                            low = int(s[i + 2:i + 6], 16)
+                            if 0xDC00 <= low <= 0xDFFF:
+                                char = 0x10000 + ((char - 0xD800) << 10) + (low - 0xDC00)
+                                i += 6
+                    string.parts.append(chr(char))
+                except ValueError:
+                    string.parts.append(s[i:i + 2])
+                    i += 2
             else:
-                result += self.current_char
-            self._advance()
-        if self.current_char == quote_char:
-            self._advance()  # Skip closing quote
-        return result
-
-    def _parse_multiline_string(self):
-        result = ""
-        quote_char = self.current_char
-        self._advance(3)  # Skip first quote
-        while self.current_char is not None:
-            if self.current_char == quote_char and self._peek(2) == quote_char * 2: # type: ignore
-                self._advance(3)  # Skip first quote
-                break
-            result += self.current_char
-            self._advance()
-        return result.strip()
+                string.parts.append(_escapes.get(escaped, s[i:i + 2])) # unknown escapes are kept as they are
+                i += 2
 
-    def _parse_number(self):
-        number_str = ""
-        while self.current_char is not None and (self.current_char.isdigit() or self.current_char in ['-', '+', '.', 'e', 'E']):
-            number_str += self.current_char
-            self._advance()
-        try:
-            return int(number_str)
-        except ValueError:
-            return float(number_str)
+    def _end_string(self):
+        string = self.string
+        assert string
+        self.string = None
+        value = "".join(string.parts)
+        if string.triple or string.quote is None: value = value.strip()
+        if string.is_key:
+            frame = self.stack[-1]
+            frame.key = value
+            frame.expect = COLON
+        else:
+            container, key = string.slot # type: ignore
+            container[key] = value
 
-    def _parse_true(self):
-        self._advance()
-        for char in 'rue':
-            if self.current_char != char:
-                return None
-            self._advance()
-        return True
+    def _publish_partial(self):
+        # make the string being streamed visible in the result, after it grew by a fraction of its visible length,
+        # so joining the parts stays linear in the length of long values
+        string = self.string
+        if string and not string.is_key:
+            string.pending += sum(len(part) for part in string.parts[string.checked:])
+            string.checked = len(string.parts)
+            if not string.pending or string.pending < string.published // PUBLISH_GROWTH: return
+            value = "".join(string.parts)
+            string.parts = [value]
+            string.published = len(value)
+            string.pending = 0
+            string.checked = 1
+            container, key = string.slot # type: ignore
+            container[key] = value.strip() if string.triple or string.quote is None else value
 
-    def _parse_false(self):
-        self._advance()
-        for char in 'alse':
-            if self.current_char != char:
-                return None
-            self._advance()
-        return False
+    def _put(self, value):
+        frame = self.stack[-1]
+        frame.expect = COMMA
+        if isinstance(frame.container, dict):
+            frame.container[frame.key] = value
+            return (frame.container, frame.key)
+        frame.container.append(value)
+        return (frame.container, len(frame.container) - 1)
 
-    def _parse_null(self):
-        self._advance()
-        for char in 'ull':
-            if self.current_char != char:
-                return None
-            self._advance()
-        return None
+    def _push(self, container, expect, doubled=False):
+        if self.stack: self._put(container)
+        else: self.result = container
+        self.stack.append(_Frame(container, expect, doubled))
 
-    def _parse_unquoted_string(self):
-        result = ""
-        while self.current_char is not None and self.current_char not in [':', ',', '}', ']']:
-            result += self.current_char
-            self._advance()
-        self._advance()
-        return result.strip()
+    def _close(self, final) -> bool:
+        frame = self.stack[-1]
+        if frame.doubled:
+            if self.index + 1 >= len(self.json_string) and not final: return False
+            if self.json_string.startswith("}", self.index + 1): self.index += 1 # handle }}
+        self.index += 1
+        self._pop()
+        return True
 
-    def _peek(self, n):
-        peek_index = self.index + 1
-        result = ''
-        for _ in range(n):
-            if peek_index < len(self.json_string):
-                result += self.json_string[peek_index]
-                peek_index += 1
-            else:
-                break
-        return result
+    def _pop(self):
+        self.stack.pop()
+        if not self.stack: self.done = True
 
-    def index_of_first_brace(self, input_str: str) -> int:
-        return input_str.find("{")
+    def _to_number(self, text: str):
+        try:
+            return int(text)
+        except ValueError:
+            try:
+                return float(text)
+            except ValueError:
+                return text
@@ -0,0 +1,147 @@
+import threading, time
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Iterator, Sequence
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain_core.embeddings import Embeddings
+from langchain_core.stores import ByteStore
+
+QUERY_CACHE_MAX_MB = 32
+BATCH_WINDOW_SECONDS = 0.01 # how long the first request waits for others to join its batch
+BATCH_MAX_TEXTS = 512
+
+# models whose embed_query is the same as embedding a single document, their queries can be batched together
+SYMMETRIC_EMBEDDINGS = ["OpenAIEmbeddings", "AzureOpenAIEmbeddings", "HuggingFaceEmbeddings"]
+
+class LRUByteStore(ByteStore):
+    # in-memory byte store that drops least recently used values over its size budget
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.values: OrderedDict[str, bytes] = OrderedDict()
+        self.lock = threading.Lock()
+
+    def mget(self, keys: Sequence[str]) -> list[bytes | None]:
+        with self.lock:
+            result = []
+            for key in keys:
+                value = self.values.get(key)
+                if value is not None: self.values.move_to_end(key)
+                result.append(value)
+            return result
+
+    def mset(self, key_value_pairs: Sequence[tuple[str, bytes]]) -> None:
+        with self.lock:
+            for key, value in key_value_pairs:
+                if key in self.values: self.size -= len(self.values.pop(key))
+                self.values[key] = value
+                self.size += len(value)
+            while self.size > self.max_bytes and self.values:
+                _, value = self.values.popitem(last=False)
+                self.size -= len(value)
+
+    def mdelete(self, keys: Sequence[str]) -> None:
+        with self.lock:
+            for key in keys:
+                if key in self.values: self.size -= len(self.values.pop(key))
+
+    def yield_keys(self, *, prefix: str | None = None) -> Iterator[str]:
+        with self.lock:
+            keys = list(self.values)
+        for key in keys:
+            if not prefix or key.startswith(prefix): yield key
+
+# query embeddings of all stores, keys are prefixed with the model namespace by CacheBackedEmbeddings
+query_cache = LRUByteStore(QUERY_CACHE_MAX_MB * 1024 * 1024)
+
+QUERY_WORKERS = 4 # concurrent embed_query calls of models that embed queries differently from documents
+
+class _Request:
+    def __init__(self, texts: list[str]):
+        self.texts = texts
+        self.future: Future = Future()
+
+class _Lane:
+    # requests arriving from many threads within a short window are merged by a worker into one provider call
+    def __init__(self, embed):
+        self.embed = embed
+        self.requests: list[_Request] = []
+        self.condition = threading.Condition()
+        self.worker: threading.Thread | None = None
+
+    def submit(self, texts: list[str]) -> list[list[float]]:
+        # large requests are split into several calls, a request queued later is not stuck behind one long call
+        requests = [_Request(texts[i:i + BATCH_MAX_TEXTS]) for i in range(0, len(texts), BATCH_MAX_TEXTS)]
+        with self.condition:
+            self.requests.extend(requests)
+            if not self.worker:
+                self.worker = threading.Thread(target=self.run, daemon=True)
+                self.worker.start()
+            self.condition.notify()
+        return [vector for r in requests for vector in r.future.result()]
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.requests: self.condition.wait()
+                first = time.monotonic()
+                while sum(len(r.texts) for r in self.requests) < BATCH_MAX_TEXTS and time.monotonic() - first < BATCH_WINDOW_SECONDS:
+                    self.condition.wait(BATCH_WINDOW_SECONDS - (time.monotonic() - first))
+                requests, count = [], 0
+                while self.requests and count + len(self.requests[0].texts) <= BATCH_MAX_TEXTS:
+                    count += len(self.requests[0].texts)
+                    requests.append(self.requests.pop(0))
+            self.process(requests)
+
+    def process(self, requests: list[_Request]):
+        unique = list(dict.fromkeys(text for r in requests for text in r.texts)) # identical texts are embedded once
+        try:
+            vectors = dict(zip(unique, self.embed(unique)))
+            for r in requests: r.future.set_result([vectors[text] for text in r.texts])
+        except Exception as e:
+            for r in requests: r.future.set_exception(e)
+
+class BatchedEmbeddings(Embeddings):
+    # batches embedding requests per model, queries never wait behind document batches:
+    # symmetric models batch them in a lane of their own, others embed each query concurrently in a small pool
+    def __init__(self, model: Embeddings):
+        self.model = model
+        self.symmetric = type(model).__name__ in SYMMETRIC_EMBEDDINGS
+        self.documents = _Lane(model.embed_documents)
+        self.queries = _Lane(model.embed_documents) if self.symmetric else None
+        self.pool = None if self.symmetric else ThreadPoolExecutor(QUERY_WORKERS, thread_name_prefix="embed_query")
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        if not texts: return []
+        return self.documents.submit(list(texts))
+
+    def embed_query(self, text: str) -> list[float]:
+        if self.queries: return self.queries.submit([text])[0]
+        return self.pool.submit(self.model.embed_query, text).result() # type: ignore
+
+# batchers are shared by all stores using the same model object
+_batchers: dict[int, BatchedEmbeddings] = {}
+_batchers_lock = threading.Lock()
+
+def get_batched(model: Embeddings) -> BatchedEmbeddings:
+    with _batchers_lock:
+        batcher = _batchers.get(id(model))
+        if not batcher or batcher.model is not model:
+            batcher = _batchers[id(model)] = BatchedEmbeddings(model)
+        return batcher
+
+def get_cached(model: Embeddings, store: ByteStore) -> CacheBackedEmbeddings:
+    # document embeddings cached in the store, requests from all stores are batched per model,
+    # query embeddings are kept in the shared in-memory LRU
+    return CacheBackedEmbeddings.from_bytes_store(
+        get_batched(model),
+        store,
+        namespace=getattr(model, 'model', getattr(model, 'model_name', "default")),
+        query_embedding_cache=query_cache )
+
+def embed_queries(embedder: Embeddings, queries: list[str]) -> list[list[float]]:
+    # concurrent queries are merged into one provider call by the batcher
+    if len(queries) < 2: return [embedder.embed_query(query) for query in queries]
+    with ThreadPoolExecutor(min(len(queries), 16)) as pool:
+        return list(pool.map(embedder.embed_query, queries))
@@ -14,6 +14,16 @@ def json_parse_dirty(json:str) -> dict[str,Any] | None:
         if isinstance(data,dict): return data
     return None
 
+def json_parse_tool_requests(json:str) -> list[dict[str,Any]] | None:
+    data = json_parse_dirty(json)
+    if data is None: return None
+    # multiple independent tools can be requested at once in "tool_calls"
+    calls = data.get("tool_calls")
+    if isinstance(calls, list):
+        requests = [call for call in calls if isinstance(call, dict)]
+        if requests: return requests
+    return [data]
+
 def extract_json_object_string(content):
     start = content.find('{')
     if start == -1:
@@ -1,20 +1,48 @@
 import os, re, sys
+from dataclasses import dataclass
+
+@dataclass
+class Template:
+    mtime: float
+    content: str
+    parts: list[str] # literal text on even indexes, placeholder names on odd indexes
+
+# compiled templates keyed by absolute path, invalidated by file mtime
+_templates: dict[str, Template] = {}
+_placeholder = re.compile(r'\{\{(\w+)\}\}')
 
 def read_file(relative_path, **kwargs):
+    template = get_template(relative_path)
+    if not kwargs: return template.content
+    return render_template(template, **kwargs)
+
+def get_template(relative_path) -> Template:
     absolute_path = get_abs_path(relative_path)  # Construct the absolute path to the target file
+    mtime = os.path.getmtime(absolute_path)
+
+    template = _templates.get(absolute_path)
+    if template and template.mtime == mtime:
+        return template
 
     with open(absolute_path) as f:
         content = remove_code_fences(f.read())
 
-    # Replace placeholders with values from kwargs
-    for key, value in kwargs.items():
-        placeholder = "{{" + key + "}}"
-        strval = str(value)
-        # strval = strval.encode('unicode_escape').decode('utf-8')
-        # content = re.sub(re.escape(placeholder), strval, content)
-        content = content.replace(placeholder, strval)
+    template = Template(mtime=mtime, content=content, parts=_placeholder.split(content))
+    _templates[absolute_path] = template
+    return template
+
+def render_template(template: Template, **kwargs):
+    # Replace placeholders with values from kwargs, unknown placeholders are kept as they are
+    parts = template.parts
+    out = [parts[0]]
+    for i in range(1, len(parts), 2):
+        key = parts[i]
+        out.append(str(kwargs[key]) if key in kwargs else "{{" + key + "}}")
+        out.append(parts[i+1])
+    return "".join(out)
 
-    return content
+def clear_cache():
+    _templates.clear()
 
 def remove_code_fences(text):
     return re.sub(r'~~~\w*\n|~~~', '', text)
@@ -30,4 +58,4 @@ def exists(*relative_paths):
 def get_base_dir():
     # Get the base directory from the current file path
     base_dir = os.path.dirname(os.path.abspath(os.path.join(__file__,"../../")))
-    return base_dir
\ No newline at end of file
+    return base_dir
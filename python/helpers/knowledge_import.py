@@ -2,6 +2,8 @@ import glob
 import os
 import hashlib
 import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
 from typing import Any, Dict, Literal, TypedDict
 from langchain_community.document_loaders import (
     CSVLoader, JSONLoader, PyPDFLoader, TextLoader, UnstructuredHTMLLoader, 
@@ -16,31 +18,47 @@ text_loader_kwargs = {'autodetect_encoding': True}
 class KnowledgeImport(TypedDict):
     file: str
     checksum: str
+    mtime: float
+    size: int
     ids: list[str]
+    chunks: list[str] # content hash of each chunk, same order as ids
     state: Literal["changed", "original", "removed"]
     documents: list[Any]
 
+# Mapping file extensions to corresponding loader classes
+file_types_loaders = {
+    'txt': TextLoader,
+    'pdf': PyPDFLoader,
+    'csv': CSVLoader,
+    'html': UnstructuredHTMLLoader,
+    'json': JSONLoader,
+    'md': UnstructuredMarkdownLoader
+}
+
+CHECKSUM_BLOCK = 1024 * 1024
+PARSE_WORKERS = os.cpu_count() or 1
+
 
 def calculate_checksum(file_path: str) -> str:
     hasher = hashlib.md5()
     with open(file_path, 'rb') as f:
-        buf = f.read()
-        hasher.update(buf)
+        while block := f.read(CHECKSUM_BLOCK): # constant memory for large files
+            hasher.update(block)
     return hasher.hexdigest()
 
+def get_chunk_hash(doc: Any) -> str:
+    metadata = {k: v for k, v in doc.metadata.items() if k != "id"}
+    return hashlib.md5((doc.page_content + json.dumps(metadata, sort_keys=True, default=str)).encode()).hexdigest()
+
+def load_file(file_path: str) -> list[Any]:
+    # runs in a worker process, documents are pickled back
+    ext = file_path.split('.')[-1].lower()
+    loader_cls = file_types_loaders[ext]
+    loader = loader_cls(file_path, **(text_loader_kwargs if ext in ['txt', 'csv', 'html', 'md'] else {}))
+    return loader.load_and_split()
+
 def load_knowledge(logger: Log, knowledge_dir: str, index: Dict[str, KnowledgeImport]) -> Dict[str, KnowledgeImport]:
     knowledge_dir = files.get_abs_path(knowledge_dir)
-    
-
-    # Mapping file extensions to corresponding loader classes
-    file_types_loaders = {
-        'txt': TextLoader,
-        'pdf': PyPDFLoader,
-        'csv': CSVLoader,
-        'html': UnstructuredHTMLLoader,
-        'json': JSONLoader,
-        'md': UnstructuredMarkdownLoader
-    }
 
     cnt_files = 0
     cnt_docs = 0
@@ -51,32 +69,54 @@ def load_knowledge(logger: Log, knowledge_dir: str, index: Dict[str, KnowledgeIm
         print(f"Found {len(kn_files)} knowledge files in {knowledge_dir}, processing...")
         logger.log(type="info", content=f"Found {len(kn_files)} knowledge files in {knowledge_dir}, processing...")
 
+    changed: dict[str, str] = {} # file key -> path of files to parse
     for file_path in kn_files:
         ext = file_path.split('.')[-1].lower()
         if ext in file_types_loaders:
-            checksum = calculate_checksum(file_path)
             file_key = os.path.relpath(file_path, knowledge_dir)
+            stat = os.stat(file_path)
             
             # Load existing data from the index or create a new entry
             file_data = index.get(file_key, {})
             
-            if file_data.get('checksum') == checksum:
+            # unchanged size and mtime skip hashing, a matching checksum skips parsing
+            if file_data.get('checksum') and file_data.get('mtime') == stat.st_mtime and file_data.get('size') == stat.st_size:
                 file_data['state'] = 'original'
             else:
-                file_data['state'] = 'changed'
+                checksum = calculate_checksum(file_path)
+                file_data['state'] = 'original' if file_data.get('checksum') == checksum else 'changed'
+                file_data['checksum'] = checksum
+                file_data['mtime'] = stat.st_mtime
+                file_data['size'] = stat.st_size
             
             if file_data['state'] == 'changed':
-                file_data['checksum'] = checksum
-                loader_cls = file_types_loaders[ext]
-                loader = loader_cls(file_path, **(text_loader_kwargs if ext in ['txt', 'csv', 'html', 'md'] else {}))
-                file_data['documents'] = loader.load_and_split()
-                cnt_files += 1
-                cnt_docs += len(file_data['documents'])
-                # print(f"Imported {len(file_data['documents'])} documents from {file_path}")
+                changed[file_key] = file_path
             
             # Update the index
             index[file_key] = file_data # type: ignore
 
+    # parse changed files on all cores, small batches are not worth starting processes,
+    # workers are spawned, forking this process could copy locks held by its other threads into them
+    if len(changed) > 1 and PARSE_WORKERS > 1:
+        with ProcessPoolExecutor(max_workers=min(PARSE_WORKERS, len(changed)), mp_context=multiprocessing.get_context("spawn")) as executor:
+            futures = {file_key: executor.submit(load_file, file_path) for file_key, file_path in changed.items()}
+            results = {file_key: _get_result(future.result) for file_key, future in futures.items()}
+    else:
+        results = {file_key: _get_result(lambda: load_file(file_path)) for file_key, file_path in changed.items()}
+
+    for file_key, documents in results.items():
+        file_data = index[file_key]
+        if isinstance(documents, Exception):
+            # keep the previous version, the file is parsed again on next start
+            print(f"Error loading knowledge file {changed[file_key]}: {documents}")
+            logger.log(type="error", content=f"Error loading knowledge file {changed[file_key]}: {documents}")
+            file_data['state'] = 'original'
+            file_data['checksum'] = file_data['mtime'] = file_data['size'] = None # type: ignore
+            continue
+        file_data['documents'] = documents
+        cnt_files += 1
+        cnt_docs += len(documents)
+
     # loop index where state is not set and mark it as removed
     for file_key, file_data in index.items():
         if not file_data.get('state', ''):
@@ -85,3 +125,9 @@ def load_knowledge(logger: Log, knowledge_dir: str, index: Dict[str, KnowledgeIm
     print(f"Processed {cnt_docs} documents from {cnt_files} files.")
     logger.log(type="info", content=f"Processed {cnt_docs} documents from {cnt_files} files.")
     return index
+
+def _get_result(func):
+    try:
+        return func()
+    except Exception as e:
+        return e
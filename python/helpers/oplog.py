@@ -0,0 +1,69 @@
+import base64, json, os
+from typing import Iterator
+import numpy as np
+
+# append-only log of vector store changes, one json operation per line, fsynced on every append
+class OpLog:
+    def __init__(self, path: str):
+        self.path = path
+        self.file = None
+
+    def append(self, op: dict):
+        if not self.file:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self.file = open(self.path, "a", encoding="utf-8")
+        self.file.write(json.dumps(op) + "\n")
+        self.file.flush()
+        os.fsync(self.file.fileno()) # durable before the change is applied in memory
+
+    def rotate(self, path: str) -> bool:
+        # move the current log aside, following appends go to a new file
+        self.close()
+        if not os.path.exists(self.path): return False
+        if os.path.exists(path): # left over by a failed compaction, keep both
+            with open(path, "a", encoding="utf-8") as target, open(self.path, encoding="utf-8") as source:
+                target.write(source.read())
+                target.flush()
+                os.fsync(target.fileno())
+            os.remove(self.path)
+        else:
+            os.replace(self.path, path)
+        return True
+
+    def close(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+
+def read(path: str) -> Iterator[dict]:
+    if not os.path.exists(path): return
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return # torn last line after a crash, the operation was never applied
+
+def repair(path: str):
+    # cut a torn last line, appends would otherwise continue it and be lost on the next replay
+    if not os.path.exists(path): return
+    valid = 0
+    with open(path, "rb") as f:
+        for line in f:
+            try:
+                if not line.endswith(b"\n"): break
+                json.loads(line)
+            except ValueError:
+                break
+            valid += len(line)
+    if valid < os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(valid)
+            os.fsync(f.fileno())
+
+def encode_vectors(vectors) -> list[str]:
+    # float32 bytes are exact and much smaller than json floats
+    return [base64.b64encode(np.asarray(v, dtype=np.float32).tobytes()).decode() for v in vectors]
+
+def decode_vectors(data: list[str]) -> list[list[float]]:
+    return [np.frombuffer(base64.b64decode(v), dtype=np.float32).tolist() for v in data]
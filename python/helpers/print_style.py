@@ -81,11 +81,7 @@ class PrintStyle:
             self.padding_added = True
 
     def _log_html(self, html):
-<<<<<<< HEAD
         with open(PrintStyle.log_file_path, "a", encoding="utf-8") as f: # type: ignore
-=======
-        with open(PrintStyle.log_file_path, "a", encoding='utf-8') as f: # type: ignore # add encoding='utf-8'
->>>>>>> 2aedd5fd9d2290f857dfa23f2b5ed656b7e8fe13
             f.write(html)
 
     @staticmethod
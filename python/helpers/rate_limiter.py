@@ -1,3 +1,5 @@
+import asyncio
+import threading
 import time
 from collections import deque
 from dataclasses import dataclass
@@ -10,58 +12,81 @@ class CallRecord:
     timestamp: float
     input_tokens: int
     output_tokens: int = 0  # Default to 0, will be set separately
+    in_window: bool = True
 
 class RateLimiter:
-    def __init__(self, logger: Log, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int = 60):
-        self.logger = logger
+    def __init__(self, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int = 60):
         self.max_calls = max_calls
         self.max_input_tokens = max_input_tokens
         self.max_output_tokens = max_output_tokens
         self.window_seconds = window_seconds
         self.call_records: deque = deque()
+        # running totals of records in the window
+        self.input_tokens = 0
+        self.output_tokens = 0
+        # limiter is shared by agents of all contexts, each running in its own thread and event loop
+        self._lock = threading.Lock()
 
     def _clean_old_records(self, current_time: float):
         while self.call_records and current_time - self.call_records[0].timestamp > self.window_seconds:
-            self.call_records.popleft()
+            record = self.call_records.popleft()
+            record.in_window = False
+            self.input_tokens -= record.input_tokens
+            self.output_tokens -= record.output_tokens
 
     def _get_counts(self) -> Tuple[int, int, int]:
-        calls = len(self.call_records)
-        input_tokens = sum(record.input_tokens for record in self.call_records)
-        output_tokens = sum(record.output_tokens for record in self.call_records)
-        return calls, input_tokens, output_tokens
+        return len(self.call_records), self.input_tokens, self.output_tokens
 
-    def _wait_if_needed(self, current_time: float, new_input_tokens: int):
+    def _get_wait_reasons(self, new_input_tokens: int) -> List[str]:
+        calls, input_tokens, output_tokens = self._get_counts()
+        if not calls: return [] # a single call over the token limit would never fit, let it through
+
+        wait_reasons = []
+        if self.max_calls > 0 and calls >= self.max_calls:
+            wait_reasons.append("max calls")
+        if self.max_input_tokens > 0 and input_tokens + new_input_tokens > self.max_input_tokens:
+            wait_reasons.append("max input tokens")
+        if self.max_output_tokens > 0 and output_tokens >= self.max_output_tokens:
+            wait_reasons.append("max output tokens")
+        return wait_reasons
+
+    async def limit_call_and_input(self, input_token_count: int, logger: Log | None = None) -> CallRecord:
         while True:
-            self._clean_old_records(current_time)
-            calls, input_tokens, output_tokens = self._get_counts()
-            
-            wait_reasons = []
-            if self.max_calls > 0 and calls >= self.max_calls:
-                wait_reasons.append("max calls")
-            if self.max_input_tokens > 0 and input_tokens + new_input_tokens > self.max_input_tokens:
-                wait_reasons.append("max input tokens")
-            if self.max_output_tokens > 0 and output_tokens >= self.max_output_tokens:
-                wait_reasons.append("max output tokens")
-            
-            if not wait_reasons:
-                break
-            
-            oldest_record = self.call_records[0]
-            wait_time = oldest_record.timestamp + self.window_seconds - current_time
+            with self._lock:
+                current_time = time.time()
+                self._clean_old_records(current_time)
+                wait_reasons = self._get_wait_reasons(input_token_count)
+
+                if not wait_reasons:
+                    new_record = CallRecord(current_time, input_token_count)
+                    self.call_records.append(new_record)
+                    self.input_tokens += input_token_count
+                    return new_record
+
+                wait_time = self.call_records[0].timestamp + self.window_seconds - current_time
+
             if wait_time > 0:
                 PrintStyle(font_color="yellow", padding=True).print(f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}")
-                self.logger.log("rate_limit","Rate limit exceeded",f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}")
-                time.sleep(wait_time)
-            current_time = time.time()
-
-    def limit_call_and_input(self, input_token_count: int) -> CallRecord:
-        current_time = time.time()
-        self._wait_if_needed(current_time, input_token_count)
-        new_record = CallRecord(current_time, input_token_count)
-        self.call_records.append(new_record)
-        return new_record
+                if logger: logger.log("rate_limit","Rate limit exceeded",f"Rate limit exceeded. Waiting for {wait_time:.2f} seconds due to: {', '.join(wait_reasons)}")
+            await asyncio.sleep(max(wait_time, 0)) # do not block the event loop, interventions and logs keep going
 
-    def set_output_tokens(self, output_token_count: int):
-        if self.call_records:
-            self.call_records[-1].output_tokens += output_token_count
+    def set_output_tokens(self, output_token_count: int, record: CallRecord | None = None):
+        with self._lock:
+            if not record and self.call_records:
+                record = self.call_records[-1]
+            if record:
+                record.output_tokens += output_token_count
+                if record.in_window: self.output_tokens += output_token_count
         return self
+
+# limiters shared across all agents and contexts, keyed by model
+_limiters: dict[str, RateLimiter] = {}
+_limiters_lock = threading.Lock()
+
+def get_limiter(key: str, max_calls: int, max_input_tokens: int, max_output_tokens: int, window_seconds: int = 60) -> RateLimiter:
+    with _limiters_lock:
+        limiter = _limiters.get(key)
+        if not limiter:
+            limiter = RateLimiter(max_calls=max_calls, max_input_tokens=max_input_tokens, max_output_tokens=max_output_tokens, window_seconds=window_seconds)
+            _limiters[key] = limiter
+        return limiter
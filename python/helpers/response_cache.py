@@ -0,0 +1,73 @@
+import hashlib, json, os, time
+from typing import Any, AsyncIterator
+from python.helpers import files, tokens
+
+# responses of deterministic utility calls, one json file per key, shared across contexts and restarts
+CACHE_DIR = "tmp/response_cache"
+REPLAY_CHUNK_CHARS = 32 # size of the synthetic stream chunks
+
+def is_cacheable(model: Any) -> bool:
+    # only temperature 0 responses are reproducible enough to be reused
+    return getattr(model, "temperature", None) == 0
+
+def get_key(model: Any, *messages: str) -> str:
+    provider, name = tokens.get_model_id(model)
+    digest = hashlib.sha256(f"{provider}/{name}".encode())
+    for message in messages:
+        digest.update(b"\0" + message.encode())
+    return digest.hexdigest()
+
+def get(key: str, max_age_seconds: float) -> str | None:
+    path = _get_path(key)
+    try:
+        with open(path, encoding="utf-8") as f:
+            entry = json.load(f)
+        if max_age_seconds and time.time() - entry["created"] > max_age_seconds:
+            os.remove(path)
+            return None
+        os.utime(path) # mtime marks the last use for size eviction
+        return entry["response"]
+    except (OSError, ValueError, KeyError):
+        return None
+
+def put(key: str, response: str, max_size_bytes: int):
+    path = _get_path(key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"response": response, "created": time.time()}, f)
+    os.replace(tmp_path, path) # atomic, concurrent readers never see a partial file
+    if max_size_bytes: evict(max_size_bytes)
+
+def evict(max_size_bytes: int):
+    # remove least recently used entries until the cache fits
+    dir = files.get_abs_path(CACHE_DIR)
+    entries = []
+    for name in os.listdir(dir):
+        try:
+            stat = os.stat(os.path.join(dir, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+        except OSError:
+            pass
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_size_bytes: break
+        try:
+            os.remove(os.path.join(dir, name))
+        except OSError:
+            pass
+        total -= size
+
+def clear():
+    dir = files.get_abs_path(CACHE_DIR)
+    if os.path.isdir(dir):
+        for name in os.listdir(dir):
+            os.remove(os.path.join(dir, name))
+
+async def replay(response: str) -> AsyncIterator[str]:
+    # cached response as a stream, so printing and logging work the same as for a live call
+    for i in range(0, len(response), REPLAY_CHUNK_CHARS):
+        yield response[i:i + REPLAY_CHUNK_CHARS]
+
+def _get_path(key: str) -> str:
+    return files.get_abs_path(CACHE_DIR, f"{key}.json")
@@ -0,0 +1,130 @@
+import json, sqlite3, threading
+import numpy as np
+from typing import Any
+from collections import OrderedDict
+from typing import Iterator
+from langchain_community.docstore.base import AddableMixin, Docstore
+from langchain_core.documents import Document
+
+CACHE_SIZE = 10000 # hot documents kept in memory
+DOC_OVERHEAD = 500 # approximate bytes of a cached Document and its metadata dict beyond the text
+
+# filterable metadata attributes, documents without an area are knowledge chunks if they have a source file, memories otherwise
+AREA = "COALESCE(json_extract(metadata, '$.area'), CASE WHEN json_extract(metadata, '$.source') IS NULL THEN 'main' ELSE 'knowledge' END)"
+SOURCE = "json_extract(metadata, '$.source')"
+CREATED = "json_extract(metadata, '$.created')"
+
+class SQLiteDocstore(Docstore, AddableMixin):
+    # document texts and metadata on disk, fetched by id only for search hits
+    def __init__(self, path: str, cache_size: int = CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        self.cache: OrderedDict[str, tuple[Document, int]] = OrderedDict() # id -> (document, approximate bytes)
+        self.cache_bytes = 0
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL") # readers in other processes are not blocked by writes
+        self.connection.execute("PRAGMA synchronous=NORMAL") # changes are in the operation log as well
+        self.connection.execute("CREATE TABLE IF NOT EXISTS docs (id TEXT PRIMARY KEY, content TEXT NOT NULL, metadata TEXT NOT NULL, vector BLOB)")
+        if "vector" not in [row[1] for row in self.connection.execute("PRAGMA table_info(docs)")]:
+            self.connection.execute("ALTER TABLE docs ADD COLUMN vector BLOB") # full-precision vectors for re-ranking, added later
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS docs_area ON docs ({AREA})")
+        self.connection.execute(f"CREATE INDEX IF NOT EXISTS docs_created ON docs ({CREATED})")
+        self.connection.commit()
+
+    def add(self, texts: dict[str, Document]) -> None:
+        # replaces existing ids, replaying the operation log after a crash may add the same document again
+        rows = [(id, doc.page_content, json.dumps(doc.metadata, default=str)) for id, doc in texts.items()]
+        with self.lock:
+            self.connection.executemany("INSERT OR REPLACE INTO docs (id, content, metadata) VALUES (?, ?, ?)", rows)
+            self.connection.commit()
+            for id in texts: self._uncache(id)
+
+    def delete(self, ids: list) -> None:
+        with self.lock:
+            self.connection.executemany("DELETE FROM docs WHERE id = ?", [(id,) for id in ids])
+            self.connection.commit()
+            for id in ids: self._uncache(id)
+
+    def search(self, search: str) -> str | Document:
+        with self.lock:
+            cached = self.cache.get(search)
+            if cached is not None:
+                self.cache.move_to_end(search)
+                return cached[0]
+            row = self.connection.execute("SELECT content, metadata FROM docs WHERE id = ?", (search,)).fetchone()
+            if not row: return f"ID {search} not found."
+            doc = Document(page_content=row[0], metadata=json.loads(row[1]))
+            size = len(row[0]) + len(row[1]) + DOC_OVERHEAD
+            self.cache[search] = (doc, size)
+            self.cache_bytes += size
+            if len(self.cache) > self.cache_size: self._uncache(next(iter(self.cache)))
+            return doc
+
+    def _uncache(self, id: str):
+        # caller holds the lock
+        cached = self.cache.pop(id, None)
+        if cached: self.cache_bytes -= cached[1]
+
+    def find_ids(self, filter: dict[str, Any]) -> list[str]:
+        # ids of documents matching all given attributes: area (str or list), source (substring of the path),
+        # created_after / created_before (unix timestamps) and tags (any of them)
+        conditions = []
+        args: list = []
+        if filter.get("area"):
+            areas = filter["area"] if isinstance(filter["area"], list) else [filter["area"]]
+            conditions.append(f"{AREA} IN ({','.join('?' * len(areas))})")
+            args += areas
+        if filter.get("source"):
+            conditions.append(f"{SOURCE} LIKE '%' || ? || '%'")
+            args.append(filter["source"])
+        if filter.get("created_after") is not None:
+            conditions.append(f"{CREATED} >= ?")
+            args.append(filter["created_after"])
+        if filter.get("created_before") is not None:
+            conditions.append(f"{CREATED} < ?")
+            args.append(filter["created_before"])
+        if filter.get("tags"):
+            conditions.append(f"EXISTS (SELECT 1 FROM json_each(metadata, '$.tags') WHERE value IN ({','.join('?' * len(filter['tags']))}))")
+            args += filter["tags"]
+        where = " AND ".join(conditions) or "1"
+        with self.lock:
+            return [row[0] for row in self.connection.execute(f"SELECT id FROM docs WHERE {where}", args)]
+
+    def iter_documents(self) -> Iterator[tuple[str, Document]]:
+        # all documents in pages, bypassing the cache
+        last = 0
+        while True:
+            with self.lock:
+                rows = self.connection.execute("SELECT rowid, id, content, metadata FROM docs WHERE rowid > ? ORDER BY rowid LIMIT 1000", (last,)).fetchall()
+            if not rows: return
+            for last, id, content, metadata in rows:
+                yield id, Document(page_content=content, metadata=json.loads(metadata))
+
+    def set_vectors(self, ids: list[str], vectors) -> None:
+        rows = [(np.asarray(vector, dtype=np.float32).tobytes(), id) for id, vector in zip(ids, vectors)]
+        with self.lock:
+            self.connection.executemany("UPDATE docs SET vector = ? WHERE id = ?", rows)
+            self.connection.commit()
+
+    def get_vectors(self, ids: list[str]) -> list[np.ndarray | None]:
+        # stored full-precision vectors in the order of ids, None where missing
+        vectors: dict[str, np.ndarray] = {}
+        with self.lock:
+            for start in range(0, len(ids), 500):
+                batch = ids[start:start + 500]
+                rows = self.connection.execute(f"SELECT id, vector FROM docs WHERE id IN ({','.join('?' * len(batch))}) AND vector IS NOT NULL", batch)
+                for id, vector in rows: vectors[id] = np.frombuffer(vector, dtype=np.float32)
+        return [vectors.get(id) for id in ids]
+
+    def find_missing_vectors(self) -> list[str]:
+        with self.lock:
+            return [row[0] for row in self.connection.execute("SELECT id FROM docs WHERE vector IS NULL")]
+
+    def get_memory_size(self) -> int:
+        # only the cached documents are in memory, the rest stays in sqlite
+        return self.cache_bytes
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
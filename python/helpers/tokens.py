@@ -0,0 +1,78 @@
+from abc import ABC, abstractmethod
+from typing import Any
+
+# extra tokens each chat message costs for role and separators
+MESSAGE_OVERHEAD = 4
+
+class Tokenizer(ABC):
+    @abstractmethod
+    def count(self, text: str) -> int:
+        pass
+
+class ApproxTokenizer(Tokenizer):
+    def __init__(self, chars_per_token: float = 4):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return int(len(text) / self.chars_per_token)
+
+class TiktokenTokenizer(Tokenizer):
+    def __init__(self, encoding):
+        self.encoding = encoding
+
+    def count(self, text: str) -> int:
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+# tokenizers are shared by all agents using the same model
+_tokenizers: dict[tuple[str, str], Tokenizer] = {}
+
+def get_model_id(model: Any) -> tuple[str, str]:
+    # (provider class, model name) identifies the model for shared tokenizers, rate limiters and caches
+    provider = type(model).__name__
+    name = str(getattr(model, "model_name", None) or getattr(model, "model", None) or getattr(model, "deployment_name", None) or "")
+    return provider, name
+
+def get_tokenizer(model: Any) -> Tokenizer:
+    key = get_model_id(model)
+    if key not in _tokenizers:
+        _tokenizers[key] = _create_tokenizer(*key)
+    return _tokenizers[key]
+
+def _create_tokenizer(provider: str, name: str) -> Tokenizer:
+    if "OpenAI" in provider:
+        return _get_tiktoken(name)
+    if "Anthropic" in provider:
+        return ApproxTokenizer(3.5)
+    return ApproxTokenizer(4)
+
+def _get_tiktoken(model_name: str) -> Tokenizer:
+    try:
+        import tiktoken
+        try:
+            encoding = tiktoken.encoding_for_model(model_name)
+        except KeyError:
+            encoding = tiktoken.get_encoding("cl100k_base") # unknown model name, ie. azure deployment or openrouter model
+        return TiktokenTokenizer(encoding)
+    except Exception: # tiktoken not installed or encoding not available offline
+        return ApproxTokenizer(4)
+
+def get_cache_usage(chunk: Any) -> dict[str, int]:
+    # prompt cache statistics reported by the provider in a streamed chunk, empty if there are none
+    usage: dict[str, int] = {}
+    metadata = getattr(chunk, "usage_metadata", None) or {}
+    details = metadata.get("input_token_details") or {}
+    if metadata.get("input_tokens"): usage["input_tokens"] = metadata["input_tokens"]
+    if details.get("cache_read"): usage["cache_read"] = details["cache_read"]
+    if details.get("cache_creation"): usage["cache_creation"] = details["cache_creation"]
+
+    response = getattr(chunk, "response_metadata", None) or {}
+    raw = response.get("usage") or response.get("token_usage") or {}
+    if isinstance(raw, dict):
+        # anthropic
+        if raw.get("cache_read_input_tokens"): usage["cache_read"] = raw["cache_read_input_tokens"]
+        if raw.get("cache_creation_input_tokens"): usage["cache_creation"] = raw["cache_creation_input_tokens"]
+        # openai
+        cached = (raw.get("prompt_tokens_details") or {}).get("cached_tokens")
+        if cached: usage["cache_read"] = cached
+        if raw.get("prompt_tokens"): usage["input_tokens"] = raw["prompt_tokens"]
+    return usage
@@ -11,6 +11,8 @@ class Response:
     
 class Tool:
 
+    concurrent = False # tool can run at the same time as other concurrent tools requested in the same message
+
     def __init__(self, agent: Agent, name: str, args: dict[str,str], message: str, **kwargs) -> None:
         self.agent = agent
         self.name = name
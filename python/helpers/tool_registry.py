@@ -0,0 +1,95 @@
+import importlib, inspect, os, sys, threading, time
+from importlib import metadata
+from python.helpers import files
+from python.helpers.log import Log
+from python.helpers.print_style import PrintStyle
+
+# external packages can provide tools with entry points in this group, ie. in pyproject.toml:
+# [project.entry-points."agent_zero.tools"]
+# my_tool = "my_package.my_tool:MyTool"
+ENTRY_POINT_GROUP = "agent_zero.tools"
+TOOLS_DIR = "python/tools"
+TOOLS_PACKAGE = "python.tools"
+RELOAD_CHECK_SECONDS = 2 # tools folder is checked for changed files at most this often
+
+_tools: dict[str, type] = {} # tool name -> tool class
+_files: dict[str, float] = {} # tool name -> mtime of its file in tools folder
+_errors: dict[str, Exception] = {} # tool name -> import error, raised when the tool is used
+_loaded = False
+_checked = 0.0 # monotonic time of the last check for changed tool files
+_lock = threading.RLock()
+
+def get(name: str, log: Log | None = None) -> type | None:
+    # tools are dispatched by a dict lookup, edited tool files are picked up by the next tool call without a restart
+    if not _loaded: load(log)
+    elif time.monotonic() - _checked > RELOAD_CHECK_SECONDS: reload(log)
+    if name in _errors: raise _errors[name]
+    return _tools.get(name)
+
+def load(log: Log | None = None):
+    # scan tools folder and entry points once
+    global _loaded, _checked
+    with _lock:
+        if _loaded: return
+        for name, path in _list_tool_files().items():
+            _load_file(name, path, reload=False, log=log)
+        _load_entry_points(log)
+        _loaded = True
+        _checked = time.monotonic()
+
+def reload(log: Log | None = None):
+    # reimports changed tool files, adds new ones and drops removed ones
+    global _checked
+    with _lock:
+        if not _loaded: return load(log)
+        _checked = time.monotonic()
+        tool_files = _list_tool_files()
+        for name in list(_files):
+            if name not in tool_files:
+                _files.pop(name)
+                _tools.pop(name, None)
+                _errors.pop(name, None)
+        for name, path in tool_files.items():
+            if _files.get(name) != os.path.getmtime(path):
+                _load_file(name, path, reload=name in _files, log=log)
+
+def _list_tool_files() -> dict[str, str]:
+    tools_dir = files.get_abs_path(TOOLS_DIR)
+    return {file[:-3]: os.path.join(tools_dir, file) for file in os.listdir(tools_dir) if file.endswith(".py") and not file.startswith("_")}
+
+def _load_file(name: str, path: str, reload: bool, log: Log | None):
+    module_name = f"{TOOLS_PACKAGE}.{name}"
+    _files[name] = os.path.getmtime(path)
+    _errors.pop(name, None)
+    try:
+        if reload and module_name in sys.modules:
+            module = importlib.reload(sys.modules[module_name])
+        else:
+            module = importlib.import_module(module_name)
+    except Exception as e: # one broken tool must not take down the others, the error is raised when it is used
+        _errors[name] = e
+        _tools.pop(name, None)
+        _report(f"Failed to load tool '{name}' from {path}: {e}", log)
+        return
+    tool_class = _find_tool_class(module)
+    if tool_class: _tools[name] = tool_class
+    else: _tools.pop(name, None)
+
+def _find_tool_class(module) -> type | None:
+    from python.helpers.tool import Tool
+    class_list = [cls for _, cls in inspect.getmembers(module, inspect.isclass) if cls is not Tool and issubclass(cls, Tool)]
+    # prefer the class defined in the module itself over imported tools
+    own = [cls for cls in class_list if cls.__module__ == module.__name__]
+    return (own or class_list or [None])[0]
+
+def _load_entry_points(log: Log | None):
+    for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+        try:
+            _tools[entry_point.name] = entry_point.load()
+        except Exception as e:
+            _errors[entry_point.name] = e
+            _report(f"Failed to load tool '{entry_point.name}' from entry point: {e}", log)
+
+def _report(message: str, log: Log | None):
+    PrintStyle.error(message)
+    if log: log.log(type="error", content=message)
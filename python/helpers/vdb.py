@@ -1,49 +1,184 @@
-from langchain_core.embeddings import Embeddings
+from langchain.storage import InMemoryByteStore, LocalFileStore
+from langchain_core.documents import Document
 import chromadb
 from . import files
-import uuid
-from typing import List, Dict, Any
-
-class VectorDB:
-    def __init__(self, embeddings_model: Embeddings, cache_dir: str = "./cache"):
-        print("Initializing VectorDB...")
-        self.embeddings_model = embeddings_model
-        db_cache = files.get_abs_path(cache_dir, "database")
-        self.client = chromadb.PersistentClient(path=db_cache)
-        self.collection = self.client.get_or_create_collection("my_collection")
-
-    def search(self, query: str, results: int = 2) -> List[Dict[str, Any]]:
-        emb = self.embeddings_model.embed_query(query)
-        res = self.collection.query(query_embeddings=[emb], n_results=results)
-        return [{"id": id, "document": doc, "distance": dist} 
-                for id, doc, dist in zip(res["ids"][0], res["documents"][0], res["distances"][0])]
-
-    def delete_documents(self, query: str, score_limit: float = 0.5, batch_size: int = 10) -> int:
-        total_deleted = 0
+import json, math, threading, time, uuid
+import numpy as np
+from python.helpers import embeddings, bm25
+from python.helpers.vector_store import VectorStore
+from python.helpers.log import Log
+
+SOURCE_OVERFETCH = 10 # chroma can not filter by substring, source filters are applied to this many times the results
+PAGE_SIZE = 1000
+
+class ChromaDB(VectorStore):
+    # chroma persistent client, an alternative backend to the faiss VectorDB
+    # l2 distances like faiss, so relevance scores and thresholds mean the same for both
+    def __init__(self, logger: Log, embeddings_model, in_memory=False, memory_dir="./memory", knowledge_dir="./knowledge"):
+        self.logger = logger
+
+        print("Initializing ChromaDB...")
+        self.logger.log("info", content="Initializing ChromaDB...")
+
+        self.em_dir = files.get_abs_path(memory_dir,"embeddings")
+        self.db_dir = files.get_abs_path(memory_dir,"chroma") # separate from the faiss database, ids differ
+        self.kn_dir = files.get_abs_path(knowledge_dir) if knowledge_dir else ""
+
+        self.store = InMemoryByteStore() if in_memory else LocalFileStore(self.em_dir)
+        self.embedder = embeddings.get_cached(embeddings_model, self.store)
+        self.dimensions = len(self.embedder.embed_query("example text"))
+
+        self.client = chromadb.PersistentClient(path=self.db_dir, settings=chromadb.Settings(anonymized_telemetry=False))
+        self.collection = self.client.get_or_create_collection("memory", embedding_function=None, metadata={"hnsw:space": "l2"})
+
+        # lexical index is built on first lexical search
+        self.lexical: bm25.BM25Index | None = None
+        self.lexical_lock = threading.Lock()
+        self.version = 0
+
+        if self.kn_dir:
+            self.preload_knowledge(self.kn_dir, self.db_dir)
+
+    def insert_text(self, text, metadata:dict|None=None):
+        id = str(uuid.uuid4())
+        self.add([Document(text, metadata={"area": "main", **(metadata or {}), "id": id, "created": time.time()})], [id])
+        return id
+
+    def insert_documents(self, docs:list[Document]):
+        ids = [str(uuid.uuid4()) for _ in range(len(docs))]
+        created = time.time()
+        for doc, id in zip(docs, ids):
+            doc.metadata["id"] = id
+            doc.metadata.setdefault("created", created)
+            doc.metadata.setdefault("area", "knowledge" if doc.metadata.get("source") else "main")
+        self.add(docs, ids)
+        return ids
+
+    def add(self, docs:list[Document], ids:list[str]):
+        if not docs: return
+        texts = [doc.page_content for doc in docs]
+        vectors = self.embedder.embed_documents(texts)
+        for start in range(0, len(ids), PAGE_SIZE): # chroma limits the batch size
+            end = start + PAGE_SIZE
+            self.collection.add(ids=ids[start:end], embeddings=vectors[start:end], documents=texts[start:end], metadatas=[to_chroma(doc.metadata) for doc in docs[start:end]]) # type: ignore
+        with self.lexical_lock:
+            if self.lexical:
+                for id, text in zip(ids, texts): self.lexical.add(id, text)
+        self.version += 1
+
+    def delete_documents_by_ids(self, ids:list[str]):
+        existing = self.collection.get(ids=ids, include=[])["ids"] if ids else []
+        if not existing: return 0
+        self.collection.delete(ids=existing)
+        with self.lexical_lock:
+            if self.lexical:
+                for id in existing: self.lexical.remove(id)
+        self.version += 1
+        return len(existing)
+
+    def delete_documents_by_query(self, query:str, threshold=0.1):
+        # nearest documents in batches until one reaches past the radius
+        vector = self.embedder.embed_query(query)
+        radius = (1 - threshold) * math.sqrt(2)
+        deleted = 0
         while True:
-            results = self.search(query, results=batch_size)
-            ids_to_delete = [result["id"] for result in results if result["distance"] < score_limit]
-            
-            if not ids_to_delete:
-                break
-            
-            self.collection.delete(ids=ids_to_delete)
-            total_deleted += len(ids_to_delete)
-            
-            if len(ids_to_delete) < batch_size:
-                break
-        
-        return total_deleted
-
-    def insert(self, data: List[str]) -> List[str]:
-        ids = [str(uuid.uuid4()) for _ in data]
-        embeddings = self.embeddings_model.embed_documents(data)
-        
-        self.collection.add(
-            ids=ids,
-            embeddings=embeddings,
-            documents=data,
-        )
-        
+            hits = self.query([vector], 100)[0]
+            ids = [doc.metadata["id"] for doc, distance in hits if distance <= radius]
+            deleted += self.delete_documents_by_ids(ids)
+            if len(ids) < 100: return deleted
+
+    def search_similarity_threshold(self, query, results=3, threshold=0.5, filter:dict|None=None):
+        return self.search_batch([query], results, threshold, filter)[0]
+
+    def search_batch(self, queries:list[str], results=3, threshold=0.5, filter:dict|None=None):
+        vectors = embeddings.embed_queries(self.embedder, queries)
+        return [[doc for doc, distance in hits if 1 - distance / math.sqrt(2) >= threshold] for hits in self.query(vectors, results, filter)]
+
+    def query(self, vectors, results, filter:dict|None=None) -> list[list[tuple[Document, float]]]:
+        count = self.collection.count()
+        if not count or not vectors: return [[] for _ in vectors]
+        source = (filter or {}).get("source")
+        found = self.collection.query(query_embeddings=vectors, n_results=min(results * SOURCE_OVERFETCH if source else results, count), where=get_where(filter), include=["documents", "metadatas", "distances"]) # type: ignore
+        hits = []
+        for documents, metadatas, distances in zip(found["documents"], found["metadatas"], found["distances"]): # type: ignore
+            docs = [(Document(text, metadata=from_chroma(metadata)), distance) for text, metadata, distance in zip(documents, metadatas, distances)]
+            if source: docs = [(doc, distance) for doc, distance in docs if source in doc.metadata.get("source", "")][:results]
+            hits.append(docs)
+        return hits
+
+    def get_relevance(self, query, ids:list[str]):
+        if not ids: return {}
+        vector = np.array(self.embedder.embed_query(query), dtype=np.float32)
+        found = self.collection.get(ids=ids, include=["embeddings"])
+        return {id: 1 - float(((np.array(embedding) - vector) ** 2).sum()) / math.sqrt(2) for id, embedding in zip(found["ids"], found["embeddings"])} # type: ignore
+
+    def search_lexical(self, query, results=3, filter:dict|None=None):
+        with self.lexical_lock:
+            if not self.lexical: self.lexical = self.build_lexical()
+            allowed = set(self.find_ids(filter)) if filter else None
+            ids = [id for id, _ in self.lexical.search(query, results, allowed)]
+        if not ids: return []
+        found = self.collection.get(ids=ids, include=["documents", "metadatas"])
+        docs = {id: Document(text, metadata=from_chroma(metadata)) for id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"])} # type: ignore
+        return [docs[id] for id in ids if id in docs]
+
+    def build_lexical(self):
+        lexical = bm25.BM25Index()
+        for page in self.get_pages(None, ["documents"]):
+            for id, text in zip(page["ids"], page["documents"]): lexical.add(id, text) # type: ignore
+        return lexical
+
+    def find_ids(self, filter:dict|None) -> list[str]:
+        ids = []
+        for page in self.get_pages(get_where(filter), ["metadatas"]):
+            for id, metadata in zip(page["ids"], page["metadatas"]): # type: ignore
+                if not (filter or {}).get("source") or filter["source"] in str(metadata.get("source", "")): ids.append(id) # type: ignore
         return ids
 
+    def get_pages(self, where, include):
+        offset = 0
+        while True:
+            page = self.collection.get(where=where, include=include, limit=PAGE_SIZE, offset=offset)
+            if not page["ids"]: return
+            yield page
+            offset += len(page["ids"])
+
+    def flush(self):
+        pass # the persistent client writes every change
+
+    def close(self):
+        self.lexical = None
+
+    def get_memory_size(self) -> int:
+        # the hnsw index of chroma keeps the full vectors in memory
+        lexical = self.lexical.get_memory_size() if self.lexical else 0
+        return self.collection.count() * self.dimensions * 4 + lexical
+
+def to_chroma(metadata: dict) -> dict:
+    # chroma takes scalar metadata only, lists are stored as json and tags also as flags for filtering
+    result = {}
+    for key, value in metadata.items():
+        if value is None: continue
+        result[key] = value if isinstance(value, (str, int, float, bool)) else json.dumps(value, default=str)
+    for tag in metadata.get("tags") or []: result["tag:" + str(tag)] = True
+    return result
+
+def from_chroma(metadata: dict) -> dict:
+    result = {key: value for key, value in metadata.items() if not key.startswith("tag:")}
+    if isinstance(result.get("tags"), str): result["tags"] = json.loads(result["tags"])
+    return result
+
+def get_where(filter: dict|None) -> dict|None:
+    # chroma where clause of a metadata filter, source substrings are matched by the caller
+    conditions: list[dict] = []
+    if not filter: return None
+    if filter.get("area"):
+        areas = filter["area"] if isinstance(filter["area"], list) else [filter["area"]]
+        conditions.append({"area": {"$in": areas}})
+    if filter.get("created_after") is not None: conditions.append({"created": {"$gte": filter["created_after"]}})
+    if filter.get("created_before") is not None: conditions.append({"created": {"$lt": filter["created_before"]}})
+    if filter.get("tags"):
+        tags = [{"tag:" + str(tag): True} for tag in filter["tags"]]
+        conditions.append(tags[0] if len(tags) == 1 else {"$or": tags})
+    if not conditions: return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
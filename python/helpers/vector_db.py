@@ -1,30 +1,65 @@
 from langchain.storage import InMemoryByteStore, LocalFileStore
-from langchain.embeddings import CacheBackedEmbeddings
 # from langchain_chroma import Chroma
 from langchain_community.vectorstores import FAISS
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
 import faiss
-from langchain_community.docstore.in_memory import InMemoryDocstore
 
-import os, json
+import os, math, pickle, threading, time
+import numpy as np
 from . import files
 from langchain_core.documents import Document
 import uuid
-from python.helpers import knowledge_import
+from python.helpers import oplog, vector_index, embeddings, bm25
+from python.helpers.rwlock import RWLock
+from python.helpers.sqlite_docstore import SQLiteDocstore
+from python.helpers.vector_store import VectorStore
 from python.helpers.log import Log
 
-class VectorDB:
+TOMBSTONE_RATIO = 0.1 # deleted share of an hnsw graph that makes the next snapshot rebuild it
 
-    def __init__(self, logger: Log, embeddings_model, in_memory=False, memory_dir="./memory", knowledge_dir="./knowledge"):
+class VectorDB(VectorStore):
+    # faiss index with documents in sqlite, changes in an operation log with background snapshots
+
+    def __init__(self, logger: Log, embeddings_model, in_memory=False, memory_dir="./memory", knowledge_dir="./knowledge", compact_ops=100, compact_seconds=300, index_type="flat", index_promote_at=10000, mmap=True,
+        quantization="none", dedup_threshold=0.0, dedup_action="skip", consolidate_every=0):
         self.logger = logger
 
         print("Initializing VectorDB...")
         self.logger.log("info", content="Initializing VectorDB...")
         
         self.embeddings_model = embeddings_model
+        self.version = 0 # incremented on every change of the stored documents
 
         self.em_dir = files.get_abs_path(memory_dir,"embeddings")
         self.db_dir = files.get_abs_path(memory_dir,"database")
         self.kn_dir = files.get_abs_path(knowledge_dir) if knowledge_dir else ""
+
+        # searches share the read lock, changes take the write lock, embedding runs outside of both
+        self.lock = RWLock()
+        self.compact_lock = threading.Lock()
+        self.closed = False # set under the write lock, later changes fail before writing the log
+        self.threads: list[threading.Thread] = [] # background consolidation and snapshots, joined on close
+
+        # changes are appended to the operation log, full snapshots are written in the background
+        self.oplog = oplog.OpLog(os.path.join(self.db_dir, "oplog.jsonl"))
+        self.compacting_path = os.path.join(self.db_dir, "oplog.compacting")
+        self.compact_ops = compact_ops
+        self.compact_seconds = compact_seconds
+        self.pending_ops = 0 # operations not in the snapshot yet
+        self.last_snapshot = time.time()
+
+        # small stores use an exact flat index, promoted to the configured type and quantization once they grow,
+        # quantized stores keep full-precision vectors in sqlite to re-rank the candidates of a search
+        self.index_type, self.quantization = vector_index.normalize(index_type, quantization)
+        self.index_promote_at = index_promote_at
+
+        # near-duplicate memories above the relevance threshold are skipped or replace the older one,
+        # existing duplicates are consolidated in the background every few inserts
+        if dedup_action not in ["skip", "replace"]: raise ValueError(f"Unknown memory dedup action '{dedup_action}', use skip or replace")
+        self.dedup_threshold = dedup_threshold
+        self.dedup_action = dedup_action
+        self.consolidate_every = consolidate_every
+        self.inserts = 0 # since the last consolidation
         
         if in_memory:
             self.store = InMemoryByteStore()
@@ -33,124 +68,485 @@ class VectorDB:
 
 
         #here we setup the embeddings model with the chosen cache storage
-        self.embedder = CacheBackedEmbeddings.from_bytes_store(
-            embeddings_model, 
-            self.store, 
-            namespace=getattr(embeddings_model, 'model', getattr(embeddings_model, 'model_name', "default")) )
+        self.embedder = embeddings.get_cached(embeddings_model, self.store)
 
         # self.db = Chroma(
         #     embedding_function=self.embedder,
         #     persist_directory=db_dir)
 
         
-        # if db folder exists and is not empty:
-        if os.path.exists(self.db_dir) and files.exists(self.db_dir,"index.faiss"):
-            self.db = FAISS.load_local(
-                folder_path=self.db_dir,
-                embeddings=self.embedder,
-                allow_dangerous_deserialization=True
-            )
+        os.makedirs(self.db_dir, exist_ok=True)
+        self.finish_snapshot() # complete a snapshot interrupted by a crash
+
+        # documents live in sqlite and are read only for hits, the index file is memory-mapped where faiss supports it
+        self.index_path = os.path.join(self.db_dir, "index.faiss")
+        self.mmap = mmap
+        docstore = SQLiteDocstore(os.path.join(self.db_dir, "docs.sqlite"))
+        legacy_path = os.path.join(self.db_dir, "index.pkl")
+        if os.path.exists(self.index_path) and os.path.exists(legacy_path):
+            # pickled in-memory docstore of older versions, moved to sqlite and removed after the next snapshot
+            with open(legacy_path, "rb") as f:
+                legacy_docstore, index_to_docstore_id = pickle.load(f)
+            docstore.add(legacy_docstore._dict)
+            self.db = FAISS(self.embedder, vector_index.wrap(faiss.read_index(self.index_path)), docstore, index_to_docstore_id)
+            self.pending_ops += 1
+        elif os.path.exists(self.index_path):
+            with open(os.path.join(self.db_dir, "index.ids"), "rb") as f:
+                ids = pickle.load(f)
+            # label -> id, older snapshots have a list of ids by position
+            self.db = FAISS(self.embedder, vector_index.load(self.index_path, mmap), docstore, ids if isinstance(ids, dict) else dict(enumerate(ids)))
         else:
-            index = faiss.IndexFlatL2(len(self.embedder.embed_query("example text")))
+            index = vector_index.wrap(faiss.IndexFlatL2(len(self.embedder.embed_query("example text"))))
+            self.db = FAISS(self.embedder, index, docstore, {})
+
+        # vectors have stable labels, deleted ones are removed from the index or, in hnsw graphs, excluded from searches
+        labels = set(vector_index.get_labels(self.db.index).tolist())
+        self.tombstones = labels - self.db.index_to_docstore_id.keys()
+        self.next_label = max(labels | self.db.index_to_docstore_id.keys(), default=-1) + 1
+        self.excluded: tuple[int, object] = (-1, None) # (version, search parameters excluding the tombstones)
 
-            self.db = FAISS(
-                embedding_function=self.embedder,
-                index=index,
-                docstore=InMemoryDocstore(),
-                index_to_docstore_id={})
+        # lexical index is built on first lexical search
+        self.lexical: bm25.BM25Index | None = None
+        self.labels: tuple[int, dict[str, int]] = (-1, {}) # (version, id -> label) for filtered searches
+
+        # operations after the snapshot, including those of an unfinished compaction
+        for path in [self.compacting_path, self.oplog.path]:
+            oplog.repair(path)
+            for op in oplog.read(path):
+                self.apply_op(op)
+                self.pending_ops += 1
+
+        self.store_vectors() # stores created without full-precision vectors, before the index is quantized
+        self.update_index()
+        if os.path.exists(legacy_path):
+            self.flush()
+            os.remove(legacy_path)
 
         #preload knowledge files
         if self.kn_dir:
             self.preload_knowledge(self.kn_dir, self.db_dir)
         
 
-    def preload_knowledge(self, kn_dir:str, db_dir:str):
-
-        # Load the index file if it exists
-        index_path = files.get_abs_path(db_dir, "knowledge_import.json")
-
-        #make sure directory exists
-        if not os.path.exists(db_dir):
-            os.makedirs(db_dir)
-        
-        index: dict[str, knowledge_import.KnowledgeImport] = {}
-        if os.path.exists(index_path):
-            with open(index_path, 'r') as f:
-                index = json.load(f)
-       
-        index = knowledge_import.load_knowledge(self.logger,kn_dir,index)
-        
-        for file in index:
-            if index[file]['state'] in ['changed', 'removed'] and index[file].get('ids',[]): # for knowledge files that have been changed or removed and have IDs
-                self.delete_documents_by_ids(index[file]['ids']) # remove original version
-            if index[file]['state'] == 'changed':
-                index[file]['ids'] = self.insert_documents(index[file]['documents']) # insert new version
-
-        # remove index where state="removed"
-        index = {k: v for k, v in index.items() if v['state'] != 'removed'}
-        
-        # strip state and documents from index and save it
-        for file in index:
-            if "documents" in index[file]: del index[file]['documents'] # type: ignore
-            if "state" in index[file]: del index[file]['state'] # type: ignore
-        with open(index_path, 'w') as f:
-            json.dump(index, f)    
-        
     def search_similarity(self, query, results=3):
-        return self.db.similarity_search(query,results)
+        vector = self.embedder.embed_query(query)
+        with self.lock.read():
+            return [doc for doc, _ in self.search_vector(vector, results)]
     
-    def search_similarity_threshold(self, query, results=3, threshold=0.5):
-        return self.db.search(query, search_type="similarity_score_threshold", k=results, score_threshold=threshold)
+    def search_similarity_threshold(self, query, results=3, threshold=0.5, filter:dict|None=None):
+        # filter takes area, source, created_after, created_before and tags, see SQLiteDocstore.find_ids
+        vector = self.embedder.embed_query(query)
+        relevance = self.db._select_relevance_score_fn()
+        with self.lock.read():
+            if not filter:
+                docs = self.search_vector(vector, results)
+            else:
+                docs = self.search_filtered(vector, results, filter)
+        return [doc for doc, score in docs if relevance(score) >= threshold]
 
-    def search_max_rel(self, query, results=3):
-        return self.db.max_marginal_relevance_search(query,results)
+    def search_batch(self, queries:list[str], results=3, threshold=0.5, filter:dict|None=None):
+        # queries are embedded together and searched under one lock, unfiltered exact searches in one faiss call
+        vectors = embeddings.embed_queries(self.embedder, queries)
+        relevance = self.db._select_relevance_score_fn()
+        with self.lock.read():
+            index = self.db.index
+            count = len(self.db.index_to_docstore_id)
+            if not filter and vector_index.is_exact(index) and count and not self.tombstones:
+                distances, found = index.search(np.array(vectors, dtype=np.float32), min(results, count))
+                hits = [[(self.db.docstore.search(self.db.index_to_docstore_id[label]), float(distance)) for distance, label in zip(row_distances, row) if label >= 0] for row_distances, row in zip(distances, found)]
+            elif filter:
+                hits = [self.search_filtered(vector, results, filter) for vector in vectors]
+            else:
+                hits = [self.search_vector(vector, results) for vector in vectors]
+        return [[doc for doc, score in docs if relevance(score) >= threshold] for docs in hits] # type: ignore
 
-    def delete_documents_by_query(self, query:str, threshold=0.1):
-        k = 100
-        tot = 0
+    def search_filtered(self, vector, results, filter:dict):
+        # matching documents are selected in sqlite and the index only scores those, no over-fetching of k
+        labels = self.get_labels()
+        selected = np.array([labels[id] for id in self.db.docstore.find_ids(filter) if id in labels], dtype=np.int64) # type: ignore
+        if not len(selected): return []
+        return self.search_vector(vector, min(results, len(selected)), selected)
+
+    def search_vector(self, vector, results, selected:np.ndarray|None=None) -> list[tuple[Document, float]]:
+        # caller holds a lock, nearest documents with their distances, optionally among the selected labels only,
+        # lossy indexes fetch more candidates and order them by the exact distance of the full vectors
+        index = self.db.index
+        exact = vector_index.is_exact(index)
+        count = min(results if exact else results * vector_index.RERANK_FACTOR, len(self.db.index_to_docstore_id) if selected is None else len(selected))
+        if count < 1: return []
+        query = np.array([vector], dtype=np.float32)
+        if selected is None and self.tombstones:
+            distances, found = index.search(query, count, params=self.get_excluded())
+        elif selected is None:
+            distances, found = index.search(query, count)
+        elif vector_index.supports_filter(index):
+            distances, found = index.search(query, count, params=vector_index.get_search_params(index, selected))
+        else: # scan the decoded codes of the selected labels
+            approximate = vector_index.get_distances(query[0], vector_index.get_vectors(index, selected))
+            order = np.argsort(approximate)[:count]
+            distances, found = [approximate[order]], [selected[order]]
+        hits = [(self.db.index_to_docstore_id[label], float(distance)) for distance, label in zip(distances[0], found[0]) if label >= 0]
+        if not exact:
+            vectors = self.db.docstore.get_vectors([id for id, _ in hits]) # type: ignore
+            hits = [(id, distance if full is None else float(vector_index.get_distances(query[0], full))) for (id, distance), full in zip(hits, vectors)]
+            hits = sorted(hits, key=lambda hit: hit[1])[:results]
+        return [(self.db.docstore.search(id), distance) for id, distance in hits] # type: ignore
+
+    def search_radius(self, vector, radius) -> list[str]:
+        # caller holds a lock, ids of all documents within the radius
+        index = self.db.index
+        if vector_index.is_exact(index):
+            _, _, labels = index.range_search(np.array([vector], dtype=np.float32), radius)
+            return [self.db.index_to_docstore_id[label] for label in labels if label in self.db.index_to_docstore_id] # without tombstones
+        # quantized flat indexes have no range search, widen a re-ranked search until it reaches past the radius
+        count = 16
         while True:
-            # Perform similarity search with score
-            docs = self.search_similarity_threshold(query, results=k, threshold=threshold)
-
-            # Extract document IDs and filter based on score
-            # document_ids = [result[0].metadata["id"] for result in docs if result[1] < score_limit]
-            document_ids = [result.metadata["id"] for result in docs]
-            
-
-            # Delete documents with IDs over the threshold score
-            if document_ids:
-                # fnd = self.db.get(where={"id": {"$in": document_ids}})
-                # if fnd["ids"]: self.db.delete(ids=fnd["ids"])
-                # tot += len(fnd["ids"])
-                self.db.delete(ids=document_ids)
-                tot += len(document_ids)
-                                    
-            # If fewer than K document IDs, break the loop
-            if len(document_ids) < k:
-                break
-
-        if tot: self.db.save_local(folder_path=self.db_dir) # persist
-        return tot
+            hits = self.search_vector(vector, count)
+            if len(hits) < count or hits[-1][1] > radius: break
+            count *= 4
+        return [doc.metadata["id"] for doc, distance in hits if distance <= radius]
+
+    def get_labels(self):
+        # reverse of index_to_docstore_id, rebuilt after changes
+        version, labels = self.labels
+        if version != self.version:
+            labels = {id: label for label, id in self.db.index_to_docstore_id.items()}
+            self.labels = (self.version, labels)
+        return labels
+
+    def get_excluded(self):
+        # search parameters skipping the tombstones, rebuilt after changes
+        version, params = self.excluded
+        if version != self.version:
+            params = vector_index.get_search_params(self.db.index, excluded=np.array(sorted(self.tombstones), dtype=np.int64))
+            self.excluded = (self.version, params)
+        return params
+
+    def search_lexical(self, query, results=3, filter:dict|None=None):
+        # keyword search without an embedding call
+        if not self.lexical:
+            with self.lock.write():
+                if not self.lexical: self.lexical = self.build_lexical()
+        with self.lock.read():
+            allowed = set(self.db.docstore.find_ids(filter)) if filter else None # type: ignore
+            return [self.db.docstore.search(id) for id, _ in self.lexical.search(query, results, allowed)]
+
+    def build_lexical(self):
+        lexical = bm25.BM25Index()
+        ids = set(self.db.index_to_docstore_id.values())
+        for id, doc in self.db.docstore.iter_documents(): # type: ignore
+            if id in ids: lexical.add(id, doc.page_content)
+        return lexical
+
+    def get_relevance(self, query, ids:list[str]):
+        if not ids: return {}
+        vector = np.array(self.embedder.embed_query(query), dtype=np.float32) # cached after the vector search
+        relevance = self.db._select_relevance_score_fn()
+        with self.lock.read():
+            labels = self.get_labels()
+            found = [id for id in ids if id in labels]
+            vectors = self.get_vectors(self.db.index, np.array([labels[id] for id in found], dtype=np.int64))
+        return {id: relevance(float(distance)) for id, distance in zip(found, vector_index.get_distances(vector, vectors))}
+
+    def search_max_rel(self, query, results=3, candidates=20):
+        # nearest candidates re-ordered for diversity, their vectors come from the embeddings cache
+        vector = self.embedder.embed_query(query)
+        with self.lock.read():
+            docs = [doc for doc, _ in self.search_vector(vector, max(results, candidates))]
+        if not docs: return []
+        vectors = self.embedder.embed_documents([doc.page_content for doc in docs])
+        return [docs[i] for i in maximal_marginal_relevance(np.array(vector, dtype=np.float32), vectors, k=results)]
+
+    def delete_documents_by_query(self, query:str, threshold=0.1):
+        # one embedding and one range search for every match, relevance score 1 - distance/sqrt(2) >= threshold
+        vector = self.embedder.embed_query(query)
+        radius = (1 - threshold) * math.sqrt(2)
+        with self.lock.write():
+            ids = self.search_radius(vector, radius)
+            deleted = self.delete_ids(ids) # single batch, single log entry
+        self.maybe_compact()
+        return deleted
 
     def delete_documents_by_ids(self, ids:list[str]):
-        # pre = self.db.get(ids=ids)["ids"]
-        self.db.delete(ids=ids)
-        # post = self.db.get(ids=ids)["ids"]
-        #TODO? compare pre and post
-        if ids: self.db.save_local(folder_path=self.db_dir) #persist
-        return len(ids)
+        return self.delete(ids)
         
-    def insert_text(self, text):
+    def insert_text(self, text, metadata:dict|None=None):
         id = str(uuid.uuid4())
-        self.db.add_documents(documents=[ Document(text, metadata={"id": id}) ], ids=[id])
-        self.db.save_local(folder_path=self.db_dir) #persist
+        doc = Document(text, metadata={"area": "main", **(metadata or {}), "id": id, "created": time.time()})
+        vector = self.embedder.embed_documents([text])[0]
+        with self.lock.write():
+            duplicate = self.find_duplicate(vector, doc.metadata["area"]) if self.dedup_threshold else None
+            if duplicate and self.dedup_action == "skip":
+                self.logger.log("info", content=f"Memory not saved, near-duplicate of {duplicate.metadata['id']}: {text}")
+                return duplicate.metadata["id"]
+            if duplicate: # newer version of the same fact, tags of both are kept
+                tags = duplicate.metadata.get("tags", []) + [tag for tag in doc.metadata.get("tags", []) if tag not in duplicate.metadata.get("tags", [])]
+                if tags: doc.metadata["tags"] = tags
+                self.delete_ids([duplicate.metadata["id"]])
+                self.logger.log("info", content=f"Memory {duplicate.metadata['id']} replaced by near-duplicate {id}: {duplicate.page_content}")
+            self.add_locked([doc], [id], [vector])
+            self.inserts += 1
+        self.maybe_compact()
+        if self.consolidate_every and self.inserts >= self.consolidate_every:
+            self.inserts = 0
+            self.start_background(self.consolidate)
         return id
+
+    def find_duplicate(self, vector, area:str) -> Document | None:
+        # caller holds a lock
+        relevance = self.db._select_relevance_score_fn()
+        for doc, score in self.search_vector(vector, 5):
+            if relevance(score) < self.dedup_threshold: break
+            if doc.metadata.get("area", "main") == area: return doc
+        return None
+
+    def consolidate(self, area="main"):
+        # newest documents first, each is removed if it is near one already kept, comparing with the kept documents
+        # instead of joining neighbours transitively keeps a chain of small changes from collapsing into one memory
+        if not self.dedup_threshold: return 0
+        radius = (1 - self.dedup_threshold) * math.sqrt(2)
+        with self.lock.read():
+            labels = self.get_labels()
+            ids = [id for id in self.db.docstore.find_ids({"area": area}) if id in labels] # type: ignore
+            docs = [self.db.docstore.search(id) for id in ids]
+        if len(ids) < 2: return 0
+        vectors = np.array(self.embedder.embed_documents([doc.page_content for doc in docs]), dtype=np.float32) # type: ignore # cached embeddings
+        created = [doc.metadata.get("created", 0) for doc in docs] # type: ignore
+
+        kept = faiss.IndexFlatL2(vectors.shape[1])
+        duplicates = []
+        for i in sorted(range(len(ids)), key=lambda i: created[i], reverse=True):
+            if kept.ntotal and kept.search(vectors[i:i + 1], 1)[0][0][0] <= radius:
+                duplicates.append(ids[i])
+            else:
+                kept.add(vectors[i:i + 1])
+        if not duplicates: return 0
+        with self.lock.write():
+            if self.closed: return 0
+            deleted = self.delete_ids(duplicates) # ids deleted in the meantime are skipped
+        self.logger.log("info", content=f"Consolidated memories: removed {deleted} near-duplicates: {', '.join(duplicates)}")
+        self.maybe_compact()
+        return deleted
     
     def insert_documents(self, docs:list[Document]):
         ids = [str(uuid.uuid4()) for _ in range(len(docs))]
-        for doc, id in zip(docs, ids): doc.metadata["id"] = id  #add ids to documents metadata
-        self.db.add_documents(documents=docs, ids=ids)
-        self.db.save_local(folder_path=self.db_dir) #persist
+        created = time.time()
+        for doc, id in zip(docs, ids):
+            doc.metadata["id"] = id  #add ids to documents metadata
+            doc.metadata.setdefault("created", created)
+        self.add(docs, ids)
         return ids
 
+    def add(self, docs:list[Document], ids:list[str]):
+        if not docs: return
+        vectors = self.embedder.embed_documents([doc.page_content for doc in docs]) # embedded before the log entry, replay does not need the embeddings model
+        with self.lock.write():
+            self.add_locked(docs, ids, vectors)
+        self.maybe_compact()
+
+    def add_locked(self, docs:list[Document], ids:list[str], vectors):
+        # caller holds the write lock
+        texts = [doc.page_content for doc in docs]
+        self.log_op({"op": "add", "ids": ids, "texts": texts, "metadatas": [doc.metadata for doc in docs], "vectors": oplog.encode_vectors(vectors)})
+        self.append(ids, texts, [doc.metadata for doc in docs], vectors)
+        if self.lexical:
+            for id, text in zip(ids, texts): self.lexical.add(id, text)
+        self.version += 1
+        self.update_index()
+
+    def delete(self, ids:list[str]):
+        with self.lock.write():
+            deleted = self.delete_ids(ids)
+        self.maybe_compact()
+        return deleted
+
+    def delete_ids(self, ids:list[str]):
+        # caller holds the write lock
+        existing = set(self.db.index_to_docstore_id.values())
+        ids = [id for id in ids if id in existing]
+        if not ids: return 0
+        self.log_op({"op": "delete", "ids": ids})
+        self.remove(ids)
+        self.version += 1
+        return len(ids)
+
+    def log_op(self, op: dict):
+        if self.closed: raise RuntimeError("Memory database is closed")
+        self.oplog.append(op)
+        self.pending_ops += 1
+
+    def apply_op(self, op: dict):
+        # replay is idempotent, operations already in the snapshot are skipped
+        existing = set(self.db.index_to_docstore_id.values())
+        if op["op"] == "add":
+            new = [i for i, id in enumerate(op["ids"]) if id not in existing]
+            if not new: return
+            vectors = oplog.decode_vectors([op["vectors"][i] for i in new])
+            if self.lexical:
+                for i in new: self.lexical.add(op["ids"][i], op["texts"][i])
+            self.append([op["ids"][i] for i in new], [op["texts"][i] for i in new], [op["metadatas"][i] for i in new], vectors)
+        elif op["op"] == "delete":
+            ids = [id for id in op["ids"] if id in existing]
+            if ids: self.remove(ids)
+        self.version += 1
+
+    def append(self, ids:list[str], texts:list[str], metadatas:list[dict], vectors):
+        # caller holds the write lock, the vectors get the next free labels
+        self.make_writable()
+        labels = np.arange(self.next_label, self.next_label + len(ids), dtype=np.int64)
+        self.next_label += len(ids)
+        self.db.index.add_with_ids(np.array(vectors, dtype=np.float32).reshape(len(ids), self.db.index.d), labels)
+        self.db.docstore.add({id: Document(text, metadata=metadata) for id, text, metadata in zip(ids, texts, metadatas)})
+        self.db.index_to_docstore_id.update(zip(labels.tolist(), ids))
+        if self.quantization != "none": self.db.docstore.set_vectors(ids, vectors) # type: ignore
+
+    def remove(self, ids:list[str]):
+        if self.lexical:
+            for id in ids:
+                doc = self.db.docstore.search(id)
+                if isinstance(doc, Document): self.lexical.remove(id, doc.page_content) # may be gone from sqlite after a crash
+        # labels stay valid, nothing is renumbered or rebuilt here
+        labels = self.get_labels()
+        removed = [labels[id] for id in ids if id in labels]
+        self.make_writable()
+        if vector_index.supports_remove(self.db.index): self.db.index.remove_ids(np.array(removed, dtype=np.int64))
+        else: self.tombstones.update(removed) # rebuilt without them by purge_tombstones
+        for label in removed: del self.db.index_to_docstore_id[label]
+        self.db.docstore.delete(ids)
+
+    def get_live_labels(self) -> np.ndarray:
+        return np.array(sorted(self.db.index_to_docstore_id), dtype=np.int64)
+
+    def get_vectors(self, index, labels:np.ndarray) -> np.ndarray:
+        # vectors of the labels, lossy indexes take them from the docstore or the cached embeddings
+        if vector_index.is_exact(index): return vector_index.get_vectors(index, labels)
+        ids = [self.db.index_to_docstore_id[label] for label in labels]
+        vectors = self.db.docstore.get_vectors(ids) # type: ignore
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+        if missing:
+            texts = [self.db.docstore.search(ids[i]).page_content for i in missing] # type: ignore
+            for i, vector in zip(missing, self.embedder.embed_documents(texts)): vectors[i] = np.array(vector, dtype=np.float32)
+        return np.array(vectors, dtype=np.float32).reshape(len(ids), index.d)
+
+    def store_vectors(self):
+        # full-precision vectors of documents added before quantization was enabled
+        if self.quantization == "none": return
+        missing = set(self.db.docstore.find_missing_vectors()) # type: ignore
+        labels = np.array([label for label, id in self.db.index_to_docstore_id.items() if id in missing], dtype=np.int64)
+        if not len(labels): return
+        self.logger.log("info", content=f"Storing full-precision vectors of {len(labels)} documents for re-ranking...")
+        vectors = self.get_vectors(self.db.index, labels)
+        self.db.docstore.set_vectors([self.db.index_to_docstore_id[label] for label in labels], vectors) # type: ignore
+
+    def make_writable(self):
+        # memory-mapped inverted lists are read-only, the index is loaded into memory before the first change
+        if vector_index.is_mapped(self.db.index):
+            self.db.index = vector_index.load(self.index_path, mmap=False)
+
+    def update_index(self):
+        # promote a grown flat index, or convert after the configured type changed
+        index = self.db.index
+        count = len(self.db.index_to_docstore_id)
+        current = (vector_index.get_type(index), vector_index.get_quantization(index))
+        target = (self.index_type, self.quantization)
+        if current == ("flat", "none") and count < self.index_promote_at: target = current
+        if count < vector_index.min_vectors(*target): target = ("flat", "none")
+        if target == current and not vector_index.is_undertrained(index):
+            vector_index.set_search_params(index)
+            return
+
+        self.logger.log("info", content=f"Converting vector index from {'/'.join(current)} to {'/'.join(target)} ({count} vectors)...")
+        self.make_writable()
+        labels = self.get_live_labels()
+        self.db.index = vector_index.build(target[0], self.get_vectors(self.db.index, labels), target[1], labels)
+        self.tombstones = set()
+        self.pending_ops += 1
+        self.last_snapshot = 0 # snapshot the new index with the next change
+
+    def maybe_compact(self):
+        if not self.pending_ops: return
+        if self.pending_ops < self.compact_ops and time.time() - self.last_snapshot < self.compact_seconds: return
+        if self.compact_lock.locked(): return # next change will try again
+        self.start_background(self.compact)
+
+    def start_background(self, target):
+        with self.lock.read(): # close sets the flag under the write lock and joins the threads started before
+            if self.closed: return
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            thread = threading.Thread(target=target, daemon=True)
+            self.threads.append(thread)
+            thread.start()
+
+    def compact(self):
+        with self.compact_lock:
+            self.purge_tombstones()
+            # the read lock keeps writers out while serializing, searches continue, the slow disk write runs without it
+            with self.lock.read():
+                if not self.pending_ops: return
+                # documents are already in sqlite, the snapshot is the index and the ids of its labels
+                index = faiss.serialize_index(self.db.index)
+                data = pickle.dumps(dict(self.db.index_to_docstore_id))
+                self.oplog.rotate(self.compacting_path)
+                self.pending_ops = 0
+                self.last_snapshot = time.time()
+
+            os.makedirs(self.db_dir, exist_ok=True)
+            for name, content in [("index.faiss", index.tobytes()), ("index.ids", data)]:
+                with open(os.path.join(self.db_dir, name + ".tmp"), "wb") as f:
+                    f.write(content)
+                    f.flush()
+                    os.fsync(f.fileno())
+            open(os.path.join(self.db_dir, "snapshot.ready"), "w").close() # both files complete, safe to roll forward
+            self.finish_snapshot()
+
+    def purge_tombstones(self):
+        # caller holds the compact lock, an hnsw graph with many deleted nodes is rebuilt without the write lock,
+        # documents added meanwhile are copied over and those deleted meanwhile become tombstones of the new graph
+        with self.lock.read():
+            index = self.db.index
+            if len(self.tombstones) <= TOMBSTONE_RATIO * index.ntotal: return
+            labels = self.get_live_labels()
+            vectors = self.get_vectors(index, labels)
+            start = self.next_label
+        target = (vector_index.get_type(index), vector_index.get_quantization(index))
+        if len(labels) < vector_index.min_vectors(*target): target = ("flat", "none")
+        rebuilt = vector_index.build(target[0], vectors, target[1], labels)
+        with self.lock.write():
+            if self.db.index is not index: return # converted in the meantime
+            added = np.array([label for label in self.db.index_to_docstore_id if label >= start], dtype=np.int64)
+            if len(added): rebuilt.add_with_ids(self.get_vectors(index, added), added)
+            deleted = np.array(sorted(set(labels.tolist()) - self.db.index_to_docstore_id.keys()), dtype=np.int64)
+            if vector_index.supports_remove(rebuilt): rebuilt.remove_ids(deleted)
+            self.tombstones = set() if vector_index.supports_remove(rebuilt) else set(deleted.tolist())
+            self.db.index = rebuilt
+            self.version += 1 # cached search parameters refer to the old index
+            self.pending_ops += 1
+
+    def finish_snapshot(self):
+        ready = os.path.join(self.db_dir, "snapshot.ready")
+        for name in ["index.faiss", "index.ids"]:
+            tmp = os.path.join(self.db_dir, name + ".tmp")
+            if not os.path.exists(tmp): continue
+            if os.path.exists(ready): os.replace(tmp, os.path.join(self.db_dir, name))
+            else: os.remove(tmp) # incomplete snapshot, the logs still have everything
+        if os.path.exists(ready):
+            os.remove(ready)
+            if os.path.exists(self.compacting_path): os.remove(self.compacting_path)
+
+    def flush(self):
+        # write a snapshot now, ie. before shutdown
+        self.compact()
+
+    def close(self):
+        with self.lock.write():
+            self.closed = True
+            threads = list(self.threads)
+        for thread in threads: thread.join()
+        self.flush()
+        self.oplog.close()
+        self.db.docstore.close() # type: ignore
+
+    def get_memory_size(self) -> int:
+        lexical = self.lexical.get_memory_size() if self.lexical else 0
+        return vector_index.get_memory_size(self.db.index) + self.db.docstore.get_memory_size() + lexical # type: ignore
+
 
@@ -0,0 +1,184 @@
+import math
+import faiss
+import numpy as np
+
+# index types selectable for VectorDB, all use L2 distance like the original flat index
+INDEX_TYPES = ["flat", "hnsw", "ivf", "ivfpq"]
+# vector encodings, lossy ones keep the full vectors in the docstore for re-ranking
+QUANTIZATIONS = ["none", "fp16", "sq8", "pq"]
+HNSW_M = 32 # graph neighbours per node
+HNSW_EF_CONSTRUCTION = 80
+HNSW_EF_SEARCH = 64
+IVF_NPROBE = 16 # inverted lists scanned per query
+PQ_BITS = 8
+SQ8_TRAIN_MIN = 1000 # sq8 learns the value range of every dimension from its training sample
+TRAIN_SAMPLE = 20000 # training on a random sample is nearly as good and much faster
+RERANK_FACTOR = 4 # candidates fetched from a lossy index per result, re-ranked by exact distance
+
+def normalize(index_type: str, quantization: str) -> tuple[str, str]:
+    # ivf with product quantization is the ivfpq type and the other way round
+    if index_type not in INDEX_TYPES: raise ValueError(f"Unknown vector index type '{index_type}', use one of {INDEX_TYPES}")
+    if quantization not in QUANTIZATIONS: raise ValueError(f"Unknown vector quantization '{quantization}', use one of {QUANTIZATIONS}")
+    if index_type == "ivfpq": return "ivfpq", "pq"
+    if index_type == "ivf" and quantization == "pq": return "ivfpq", "pq"
+    return index_type, quantization
+
+def get_type(index) -> str:
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexHNSW): return "hnsw"
+    if isinstance(index, faiss.IndexIVFPQ): return "ivfpq"
+    if isinstance(index, faiss.IndexIVF): return "ivf"
+    return "flat"
+
+def get_quantization(index) -> str:
+    storage = _get_storage(unwrap(index))
+    if isinstance(storage, (faiss.IndexPQ, faiss.IndexIVFPQ)): return "pq"
+    if isinstance(storage, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)):
+        return "fp16" if storage.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "none"
+
+def load(path: str, mmap: bool = True):
+    # inverted lists of ivf indexes are memory-mapped read-only, processes share the pages through the os cache
+    # snapshots of older versions hold unlabelled indexes, their positions become the labels
+    index = wrap(faiss.read_index(path, faiss.IO_FLAG_MMAP if mmap else 0))
+    set_search_params(index)
+    return index
+
+def wrap(index, labels: np.ndarray | None = None):
+    # every vector has a stable int64 label that survives removals, ivf stores labels in its inverted lists,
+    # other indexes get an id map, the labels of a filled index default to its positions
+    if isinstance(index, faiss.IndexIDMap): return index
+    if isinstance(index, faiss.IndexIVF):
+        if index.direct_map.type != faiss.DirectMap.Hashtable: index.set_direct_map_type(faiss.DirectMap.Hashtable) # reconstruct by label
+        return index
+    if not index.ntotal:
+        wrapped = faiss.IndexIDMap2(index)
+        wrapped.referenced_objects = [index]
+        return wrapped
+    # the id map can only be created around an empty index, the filled one is swapped in
+    wrapped = faiss.IndexIDMap2(faiss.IndexFlatL2(index.d))
+    wrapped.index = index
+    wrapped.own_fields = False
+    wrapped.referenced_objects = [index]
+    faiss.copy_array_to_vector(np.arange(index.ntotal, dtype=np.int64) if labels is None else labels, wrapped.id_map)
+    wrapped.ntotal = index.ntotal
+    wrapped.construct_rev_map()
+    return wrapped
+
+def unwrap(index):
+    if isinstance(index, faiss.IndexIDMap): return faiss.downcast_index(index.index)
+    return index
+
+def get_labels(index) -> np.ndarray:
+    if isinstance(index, faiss.IndexIDMap): return faiss.vector_to_array(index.id_map)
+    invlists = index.invlists
+    return np.concatenate([np.zeros(0, dtype=np.int64)] + [faiss.rev_swig_ptr(invlists.get_ids(i), invlists.list_size(i)).copy() for i in range(index.nlist)])
+
+def supports_remove(index) -> bool:
+    # hnsw graphs can not remove nodes, their deleted labels are excluded in searches until the graph is rebuilt
+    return not isinstance(unwrap(index), faiss.IndexHNSW)
+
+def is_mapped(index) -> bool:
+    index = unwrap(index)
+    return isinstance(index, faiss.IndexIVF) and isinstance(faiss.downcast_InvertedLists(index.invlists), faiss.OnDiskInvertedLists)
+
+def min_vectors(index_type: str, quantization: str = "none") -> int:
+    # smallest store the index can be trained on
+    if index_type == "ivfpq" or quantization == "pq": return 2 ** PQ_BITS * 39
+    if quantization == "sq8": return SQ8_TRAIN_MIN
+    if index_type == "ivf": return 39 * 4 # a few lists with enough points each
+    return 0
+
+def create(index_type: str, dimensions: int, count: int = 0, quantization: str = "none"):
+    # new empty index, count is the expected number of vectors for sizing the inverted lists
+    index_type, quantization = normalize(index_type, quantization)
+    codes = {"none": "Flat", "fp16": "SQfp16", "sq8": "SQ8", "pq": f"PQ{_pq_subquantizers(dimensions)}x{PQ_BITS}"}[quantization]
+    if index_type == "flat":
+        if quantization == "none": return faiss.IndexFlatL2(dimensions)
+        return faiss.index_factory(dimensions, codes)
+    if index_type == "hnsw":
+        index = faiss.index_factory(dimensions, f"HNSW{HNSW_M},{codes}")
+        index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        return index
+    lists = max(1, min(int(4 * math.sqrt(count)), count // 39))
+    index = faiss.index_factory(dimensions, f"IVF{lists},{codes}")
+    if index_type == "ivfpq": index.do_polysemous_training = False # only used by polysemous search, dominates training time
+    return index
+
+def build(index_type: str, vectors: np.ndarray, quantization: str = "none", labels: np.ndarray | None = None):
+    # labelled index of the given type trained on and filled with the vectors, labels default to their positions
+    index = create(index_type, vectors.shape[1], len(vectors), quantization)
+    if not index.is_trained: index.train(_sample(vectors))
+    index = wrap(index)
+    if len(vectors): index.add_with_ids(vectors, np.arange(len(vectors), dtype=np.int64) if labels is None else labels)
+    set_search_params(index)
+    return index
+
+def is_undertrained(index) -> bool:
+    # sq8 codec of older stores trained on a single vector, every value range is empty and no vector can be found
+    storage = _get_storage(unwrap(index))
+    if not isinstance(storage, (faiss.IndexScalarQuantizer, faiss.IndexIVFScalarQuantizer)) or storage.sq.qtype != faiss.ScalarQuantizer.QT_8bit: return False
+    return not faiss.vector_to_array(storage.sq.trained)[storage.d:].any()
+
+def set_search_params(index):
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexHNSW):
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif isinstance(index, faiss.IndexIVF):
+        index.nprobe = min(IVF_NPROBE, index.nlist)
+
+def get_search_params(index, selected: np.ndarray | None = None, excluded: np.ndarray | None = None):
+    # search parameters restricting the search to the selected labels, or to all but the excluded ones
+    selector = faiss.IDSelectorBatch(selected if selected is not None else excluded)
+    if selected is None:
+        excluding = faiss.IDSelectorNot(selector)
+        excluding.selector_ref = selector # not owned by IDSelectorNot
+        selector = excluding
+    index = unwrap(index)
+    if isinstance(index, faiss.IndexHNSW): params = faiss.SearchParametersHNSW(sel=selector, efSearch=index.hnsw.efSearch)
+    elif isinstance(index, faiss.IndexIVF): params = faiss.SearchParametersIVF(sel=selector, nprobe=index.nprobe)
+    else: params = faiss.SearchParameters(sel=selector)
+    params.selector_ref = selector # keeps the selector alive as long as the parameters
+    return params
+
+def supports_filter(index) -> bool:
+    # product quantized flat indexes take no selector
+    return not isinstance(unwrap(index), faiss.IndexPQ)
+
+def is_exact(index) -> bool:
+    # whether stored vectors can be reconstructed without loss
+    storage = _get_storage(unwrap(index))
+    return isinstance(storage, (faiss.IndexFlat, faiss.IndexIVFFlat))
+
+def get_distances(query: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+    # exact squared l2 distances, on the same scale as the flat index
+    return ((vectors - query) ** 2).sum(axis=-1)
+
+def get_vectors(index, labels: np.ndarray) -> np.ndarray:
+    # stored vectors of the labels, decoded from their codes
+    if not len(labels): return np.zeros((0, index.d), dtype=np.float32)
+    return index.reconstruct_batch(np.asarray(labels, dtype=np.int64))
+
+def get_memory_size(index) -> int:
+    # approximate resident bytes of the index
+    inner = unwrap(index)
+    per_vector = _get_storage(inner).code_size
+    if isinstance(index, faiss.IndexIDMap): per_vector += 8 * 3 # labels and their reverse map
+    if isinstance(inner, faiss.IndexHNSW): per_vector += HNSW_M * 2 * 4
+    elif isinstance(inner, faiss.IndexIVF): per_vector += 8 * 3 # labels and their hashtable
+    return index.ntotal * per_vector
+
+def _get_storage(index):
+    # the index holding the vector codes, the graph of hnsw is separate
+    if isinstance(index, faiss.IndexHNSW): return faiss.downcast_index(index.storage)
+    return index
+
+def _sample(vectors: np.ndarray) -> np.ndarray:
+    if len(vectors) <= TRAIN_SAMPLE: return vectors
+    return vectors[np.random.default_rng(0).choice(len(vectors), TRAIN_SAMPLE, replace=False)]
+
+def _pq_subquantizers(dimensions: int) -> int:
+    # largest common sub-vector count that divides the dimensions, at least 8 dimensions per code
+    for count in [64, 48, 32, 24, 16, 12, 8, 4, 2]:
+        if dimensions % count == 0 and dimensions // count >= 8: return count
+    return 1
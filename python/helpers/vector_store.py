@@ -0,0 +1,140 @@
+import json, os
+from abc import ABC, abstractmethod
+from langchain_core.documents import Document
+from python.helpers import files, knowledge_import, bm25
+from python.helpers.log import Log
+
+BACKENDS = ["faiss", "chroma"]
+
+class VectorStore(ABC):
+    # interface of the memory and knowledge store backends, memory_tool only uses these methods
+    # filters take area, source, created_after, created_before and tags, see SQLiteDocstore.find_ids
+
+    logger: Log
+    version: int # incremented on every change of the stored documents, for caching search results
+
+    @abstractmethod
+    def insert_text(self, text:str, metadata:dict|None=None) -> str:
+        pass
+
+    @abstractmethod
+    def insert_documents(self, docs:list[Document]) -> list[str]:
+        pass
+
+    @abstractmethod
+    def delete_documents_by_ids(self, ids:list[str]) -> int:
+        pass
+
+    @abstractmethod
+    def delete_documents_by_query(self, query:str, threshold=0.1) -> int:
+        pass
+
+    @abstractmethod
+    def search_similarity_threshold(self, query:str, results=3, threshold=0.5, filter:dict|None=None) -> list[Document]:
+        pass
+
+    @abstractmethod
+    def search_batch(self, queries:list[str], results=3, threshold=0.5, filter:dict|None=None) -> list[list[Document]]:
+        pass
+
+    @abstractmethod
+    def search_lexical(self, query:str, results=3, filter:dict|None=None) -> list[Document]:
+        pass
+
+    @abstractmethod
+    def get_relevance(self, query:str, ids:list[str]) -> dict[str, float]:
+        # relevance scores of the documents for the query, on the scale of the search thresholds, missing ids are left out
+        pass
+
+    @abstractmethod
+    def flush(self):
+        # persist pending changes, ie. before shutdown
+        pass
+
+    @abstractmethod
+    def close(self):
+        pass
+
+    @abstractmethod
+    def get_memory_size(self) -> int:
+        pass
+
+    def search_hybrid(self, query, results=3, threshold=0.5, filter:dict|None=None):
+        # vector and lexical rankings fused by reciprocal rank, lexical hits are held to the same threshold
+        vector_docs = self.search_similarity_threshold(query, results, threshold, filter)
+        lexical_docs = self.search_lexical(query, results, filter)
+        vector_ids = {doc.metadata["id"] for doc in vector_docs}
+        relevance = self.get_relevance(query, [doc.metadata["id"] for doc in lexical_docs if doc.metadata["id"] not in vector_ids])
+        lexical_docs = [doc for doc in lexical_docs if doc.metadata["id"] in vector_ids or relevance.get(doc.metadata["id"], 0) >= threshold]
+        docs = {doc.metadata["id"]: doc for doc in lexical_docs + vector_docs} # type: ignore
+        ranked = bm25.fuse([doc.metadata["id"] for doc in vector_docs], [doc.metadata["id"] for doc in lexical_docs], count=results) # type: ignore
+        return [docs[id] for id in ranked]
+
+
+    def preload_knowledge(self, kn_dir:str, db_dir:str):
+
+        # Load the index file if it exists
+        index_path = files.get_abs_path(db_dir, "knowledge_import.json")
+
+        #make sure directory exists
+        if not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+        
+        index: dict[str, knowledge_import.KnowledgeImport] = {}
+        if os.path.exists(index_path):
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+       
+        index = knowledge_import.load_knowledge(self.logger,kn_dir,index)
+        
+        # unchanged chunks of changed files keep their ids and vectors, only new chunks are embedded
+        old_ids: list[str] = []
+        new_docs: list[tuple[list, int, Document]] = [] # (ids list of the file, position, chunk)
+        reused = 0
+        for file in index:
+            if index[file]['state'] == 'removed': old_ids += index[file].get('ids',[])
+            if index[file]['state'] != 'changed': continue
+
+            previous: dict[str, list[str]] = {}
+            for chunk, id in zip(index[file].get('chunks',[]), index[file].get('ids',[])): previous.setdefault(chunk, []).append(id)
+            chunks = [knowledge_import.get_chunk_hash(doc) for doc in index[file]['documents']]
+            ids: list = []
+            for chunk, doc in zip(chunks, index[file]['documents']):
+                if previous.get(chunk):
+                    ids.append(previous[chunk].pop(0))
+                    reused += 1
+                else:
+                    new_docs.append((ids, len(ids), doc))
+                    ids.append(None)
+            old_ids += [id for remaining in previous.values() for id in remaining]
+            index[file]['ids'] = ids
+            index[file]['chunks'] = chunks
+
+        # all old chunks are removed and all new ones embedded in one batch each, identical texts are embedded once
+        for _, _, doc in new_docs: doc.metadata["area"] = "knowledge" # after hashing, the area is not part of the chunk content
+        if old_ids: self.delete_documents_by_ids(old_ids)
+        inserted = self.insert_documents([doc for _, _, doc in new_docs])
+        for (ids, position, _), id in zip(new_docs, inserted): ids[position] = id
+        if old_ids or new_docs:
+            self.logger.log("info", content=f"Knowledge chunks: {reused} unchanged, {len(new_docs)} embedded, {len(old_ids)} removed.")
+            self.flush() # one index write for the whole import
+
+        # remove index where state="removed"
+        index = {k: v for k, v in index.items() if v['state'] != 'removed'}
+        
+        # strip state and documents from index and save it
+        for file in index:
+            if "documents" in index[file]: del index[file]['documents'] # type: ignore
+            if "state" in index[file]: del index[file]['state'] # type: ignore
+        with open(index_path, 'w') as f:
+            json.dump(index, f)
+
+def get_backend(name:str) -> type[VectorStore]:
+    # backends are imported on first use, chroma is an optional dependency
+    if name == "faiss":
+        from python.helpers.vector_db import VectorDB
+        return VectorDB
+    if name == "chroma":
+        from python.helpers.vdb import ChromaDB
+        return ChromaDB
+    raise ValueError(f"Unknown memory backend '{name}', use one of {BACKENDS}")
@@ -1,4 +1,5 @@
 import os
+import asyncio
 from python.helpers import perplexity_search
 from python.helpers import duckduckgo_search
 from . import memory_tool
@@ -8,6 +9,8 @@ from python.helpers.print_style import PrintStyle
 from python.helpers.errors import handle_error
 
 class Knowledge(Tool):
+    concurrent = True
+
     async def execute(self, question="", **kwargs):
         with concurrent.futures.ThreadPoolExecutor() as executor:
             # Schedule the two functions to be run in parallel
@@ -29,19 +32,19 @@ class Knowledge(Tool):
 
             # Wait for both functions to complete
             try:
-                perplexity_result = (perplexity.result() if perplexity else "") or ""
+                perplexity_result = ((await asyncio.wrap_future(perplexity)) if perplexity else "") or ""
             except Exception as e:
                 handle_error(e)
                 perplexity_result = "Perplexity search failed: " + str(e)
 
             try:
-                duckduckgo_result = duckduckgo.result()
+                duckduckgo_result = await asyncio.wrap_future(duckduckgo)
             except Exception as e:
                 handle_error(e)
                 duckduckgo_result = "DuckDuckGo search failed: " + str(e)
 
             try:
-                memory_result = future_memory.result()
+                memory_result = await asyncio.wrap_future(future_memory)
             except Exception as e:
                 handle_error(e)
                 memory_result = "Memory search failed: " + str(e)
@@ -50,6 +53,6 @@ class Knowledge(Tool):
                               online_sources = ((perplexity_result + "\n\n") if perplexity else "") + str(duckduckgo_result),
                               memory = memory_result )
 
-        if self.agent.handle_intervention(msg): pass # wait for intervention and handle it, if paused
+        await self.agent.handle_intervention() # wait for intervention and handle it, if paused
 
         return Response(message=msg, break_loop=False)
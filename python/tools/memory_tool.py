@@ -1,15 +1,30 @@
 import re
+import asyncio
+import threading, time
+from contextlib import contextmanager
+from datetime import datetime
 from agent import Agent
-from python.helpers.vector_db import VectorDB, Document
+from python.helpers.vector_store import VectorStore, get_backend
 import os
 from python.helpers.tool import Tool, Response
 from python.helpers.print_style import PrintStyle
 from python.helpers.errors import handle_error
+from python.helpers import bm25
 
-# databases based on subdirectories from agent config
-dbs = {}
+# databases based on subdirectories from agent config, loaded on first use and evicted when idle or over budget
+dbs: dict[tuple[str, str, str], VectorStore] = {}
+dbs_lock = threading.Lock() # guards the dicts below, held only briefly
+db_locks: dict[tuple[str, str, str], threading.Lock] = {} # held while a store is loaded or closed, contexts opening it at once share one instance
+in_use: dict[tuple[str, str, str], int] = {} # operations running on each store, those stores are not evicted
+last_access: dict[tuple[str, str, str], float] = {}
+cache_limits = {"max_bytes": 0, "idle_seconds": 0} # from the config of the last agent using the cache
+MIN_IDLE_SECONDS = 60 # stores used this recently are kept, a store is not reloaded between the turns of a conversation
+SWEEP_SECONDS = 60
+sweeper: threading.Thread | None = None
 
 class Memory(Tool):
+    concurrent = True
+
     async def execute(self,**kwargs):
         result=""
         
@@ -17,13 +32,15 @@ class Memory(Tool):
             if "query" in kwargs:
                 threshold = float(kwargs.get("threshold", 0.1))
                 count = int(kwargs.get("count", 5))
-                result = search(self.agent, kwargs["query"], count, threshold)
+                result = await asyncio.to_thread(search, self.agent, kwargs["query"], count, threshold, kwargs.get("mode", ""), get_filter(kwargs))
             elif "memorize" in kwargs:
-                result = save(self.agent, kwargs["memorize"])
+                metadata = {"area": kwargs["area"]} if kwargs.get("area") else {}
+                if kwargs.get("tags"): metadata["tags"] = get_tags(kwargs["tags"])
+                result = await asyncio.to_thread(save, self.agent, kwargs["memorize"], metadata)
             elif "forget" in kwargs:
-                result = forget(self.agent, kwargs["forget"])
+                result = await asyncio.to_thread(forget, self.agent, kwargs["forget"])
             elif "delete" in kwargs:
-                result = delete(self.agent, kwargs["delete"])
+                result = await asyncio.to_thread(delete, self.agent, kwargs["delete"])
         except Exception as e:
             handle_error(e)
             # hint about embedding change with existing database
@@ -34,41 +51,135 @@ class Memory(Tool):
         # result = process_query(self.agent, self.args["memory"],self.args["action"], result_count=self.agent.config.auto_memory_count)
         return Response(message=result, break_loop=False)
             
-def search(agent:Agent, query:str, count:int=5, threshold:float=0.1):
-    db = get_db(agent)
-    # docs = db.search_similarity(query,count) # type: ignore
-    docs = db.search_similarity_threshold(query,count,threshold) # type: ignore
+def get_filter(kwargs: dict) -> dict:
+    # metadata filter from tool arguments, dates are ISO format
+    filter = {}
+    if kwargs.get("area"): filter["area"] = kwargs["area"]
+    if kwargs.get("source"): filter["source"] = kwargs["source"]
+    if kwargs.get("tags"): filter["tags"] = get_tags(kwargs["tags"])
+    if kwargs.get("after"): filter["created_after"] = datetime.fromisoformat(str(kwargs["after"])).timestamp()
+    if kwargs.get("before"): filter["created_before"] = datetime.fromisoformat(str(kwargs["before"])).timestamp()
+    return filter
+
+def get_tags(tags) -> list[str]:
+    if isinstance(tags, str): tags = tags.split(",")
+    return [str(tag).strip() for tag in tags if str(tag).strip()]
+
+def search(agent:Agent, query:str, count:int=5, threshold:float=0.1, mode:str="", filter:dict|None=None):
+    docs = search_documents(agent, query, count, threshold, mode, filter)
     if len(docs)==0: return agent.read_prompt("fw.memories_not_found.md", query=query)
     else: return str(docs)
 
-def save(agent:Agent, text:str):
-    db = get_db(agent)
-    id = db.insert_text(text) # type: ignore
+def search_documents(agent:Agent, query:str, count:int=5, threshold:float=0.1, mode:str="", filter:dict|None=None):
+    with use_db(agent) as db:
+        mode = mode or agent.config.memory_search_mode
+        if mode == "auto": mode = "lexical" if bm25.is_keyword_query(query) else "hybrid" # keywords skip the embedding call
+        if mode == "lexical": return db.search_lexical(query,count,filter)
+        if mode == "hybrid": return db.search_hybrid(query,count,threshold,filter)
+        # docs = db.search_similarity(query,count) # type: ignore
+        return db.search_similarity_threshold(query,count,threshold,filter) # type: ignore
+
+def save(agent:Agent, text:str, metadata:dict|None=None):
+    with use_db(agent) as db:
+        id = db.insert_text(text, metadata) # type: ignore
     return agent.read_prompt("fw.memory_saved.md", memory_id=id)
 
 def delete(agent:Agent, ids_str:str):
-    db = get_db(agent)
     ids = extract_guids(ids_str)
-    deleted = db.delete_documents_by_ids(ids) # type: ignore
+    with use_db(agent) as db:
+        deleted = db.delete_documents_by_ids(ids) # type: ignore
     return agent.read_prompt("fw.memories_deleted.md", memory_count=deleted)    
 
 def forget(agent:Agent, query:str):
-    db = get_db(agent)
-    deleted = db.delete_documents_by_query(query) # type: ignore
+    with use_db(agent) as db:
+        deleted = db.delete_documents_by_query(query) # type: ignore
     return agent.read_prompt("fw.memories_deleted.md", memory_count=deleted)
 
-def get_db(agent: Agent):
-    mem_dir = os.path.join("memory", agent.config.memory_subdir)
-    kn_dir = os.path.join("knowledge", agent.config.knowledge_subdir)
-    key = (mem_dir, kn_dir)
+def get_version(agent:Agent) -> int:
+    # first use loads the store
+    with use_db(agent) as db:
+        return db.version
 
-    if key not in dbs:
-        db = VectorDB(agent.context.log,embeddings_model=agent.config.embeddings_model, in_memory=False, memory_dir=mem_dir, knowledge_dir=kn_dir)
-        dbs[key] = db
-    else:
-        db = dbs[key]
+@contextmanager
+def use_db(agent: Agent):
+    # the store is checked out for the duration of an operation, eviction skips it until it is returned
+    key = (os.path.join("memory", agent.config.memory_subdir), os.path.join("knowledge", agent.config.knowledge_subdir), agent.config.memory_backend)
+    db = open_db(agent, key)
+    try:
+        yield db
+    finally:
+        with dbs_lock:
+            in_use[key] -= 1
+            last_access[key] = time.time()
 
+def open_db(agent: Agent, key):
+    global sweeper
+    while True:
+        with dbs_lock:
+            if key in dbs:
+                db = dbs[key]
+                in_use[key] += 1
+                last_access[key] = time.time()
+                cache_limits["max_bytes"] = agent.config.memory_cache_max_mb * 1024 * 1024
+                cache_limits["idle_seconds"] = agent.config.memory_cache_idle_seconds
+                evicted = evict_dbs()
+                if not sweeper:
+                    sweeper = threading.Thread(target=sweep_dbs, daemon=True)
+                    sweeper.start()
+                break
+            db_lock = db_locks.setdefault(key, threading.Lock())
+        # loading (knowledge preload included) and closing of a store only block others using the same store
+        with db_lock:
+            with dbs_lock:
+                if key in dbs: continue # loaded by another context meanwhile
+            mem_dir, kn_dir, backend = key
+            options = {}
+            if backend == "faiss":
+                options = dict(index_type=agent.config.memory_index_type, index_promote_at=agent.config.memory_index_promote_at, quantization=agent.config.memory_quantization,
+                    dedup_threshold=agent.config.memory_dedup_threshold, dedup_action=agent.config.memory_dedup_action, consolidate_every=agent.config.memory_consolidate_every)
+            db = get_backend(backend)(agent.context.log,embeddings_model=agent.config.embeddings_model, in_memory=False, memory_dir=mem_dir, knowledge_dir=kn_dir, **options)
+            with dbs_lock:
+                dbs[key] = db
+                in_use[key] = 0
+                last_access[key] = time.time()
+    close_dbs(evicted)
     return db
+
+def evict_dbs() -> list:
+    # caller holds dbs_lock, evicted stores are removed here and closed by the caller after releasing it, reloaded on next use
+    now = time.time()
+    candidates = sorted((key for key in dbs if not in_use[key] and now - last_access[key] > MIN_IDLE_SECONDS), key=lambda key: last_access[key])
+    evicted = []
+    def evict(key):
+        if not db_locks[key].acquire(blocking=False): return 0 # being loaded again, next time
+        evicted.append((key, dbs.pop(key)))
+        del in_use[key], last_access[key]
+        return evicted[-1][1].get_memory_size()
+    if cache_limits["idle_seconds"]:
+        for key in [key for key in candidates if now - last_access[key] > cache_limits["idle_seconds"]]:
+            evict(key)
+            candidates.remove(key)
+    if cache_limits["max_bytes"]:
+        total = sum(db.get_memory_size() for db in dbs.values())
+        for key in candidates: # least recently used first
+            if total <= cache_limits["max_bytes"]: break
+            total -= evict(key)
+    return evicted
+
+def close_dbs(evicted: list):
+    # the lock of each store is held from eviction until it is closed, a new instance waits for the final snapshot
+    for key, db in evicted:
+        try:
+            db.close()
+        finally:
+            db_locks[key].release()
+
+def sweep_dbs():
+    while True:
+        time.sleep(SWEEP_SECONDS)
+        with dbs_lock:
+            evicted = evict_dbs()
+        close_dbs(evicted)
         
 def extract_guids(text):
     pattern = r'\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[1-5][0-9a-fA-F]{3}-[89abAB][0-9a-fA-F]{3}-[0-9a-fA-F]{12}\b'
@@ -1,3 +1,4 @@
+import asyncio
 import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urlparse
@@ -7,7 +8,12 @@ from python.helpers.errors import handle_error
 
 
 class WebpageContentTool(Tool):
+    concurrent = True
+
     async def execute(self, url="", **kwargs):
+        return await asyncio.to_thread(self.get_content, url) # blocking download, keep the event loop free for other tools
+
+    def get_content(self, url: str):
         if not url:
             return Response(message="Error: No URL provided.", break_loop=False)
 
@@ -0,0 +1,67 @@
+import copy
+import unittest
+from python.helpers.dirty_json import DirtyJson, copy_containers
+
+
+def feed_chunks(text: str, size: int):
+    parser = DirtyJson()
+    results = []
+    for i in range(0, len(text), size):
+        results.append(copy.deepcopy(parser.feed(text[i:i + size]))) # result is updated in place
+    return parser, results
+
+
+class TestDirtyJsonStream(unittest.TestCase):
+    def test_stream_matches_parse(self):
+        json_string = ('Sure {"thoughts": ["first", "second"], "tool_name": "code_execution_tool", '
+                       '"tool_args": {"runtime": "python", "code": "print(\\"a\\")\\nx = {\'b\': 1}"}} trailing')
+        for size in [1, 2, 3, 7, 50]:
+            parser, _ = feed_chunks(json_string, size)
+            self.assertEqual(parser.finish(), DirtyJson.parse_string(json_string))
+
+    def test_partial_values_published(self):
+        _, results = feed_chunks('{"tool_name": "response", "tool_args": {"text": "Hello world"}}', 1)
+        self.assertIn({"tool_name": "response", "tool_args": {"text": "Hello"}}, results)
+        self.assertEqual(results[-1], {"tool_name": "response", "tool_args": {"text": "Hello world"}})
+
+    def test_long_value_published_in_steps(self):
+        parser = DirtyJson()
+        lengths = []
+        text = '{"code": "' + "a" * 10000 + '"}'
+        for i in range(0, len(text), 16):
+            result = parser.feed(text[i:i + 16])
+            if result and "code" in result: lengths.append(len(result["code"]))
+        self.assertLess(len(set(lengths)), 100) # joined a few dozen times, not on every chunk
+        self.assertEqual(lengths[-1], 10000)
+
+    def test_copy_containers(self):
+        parser = DirtyJson()
+        copied = copy_containers(parser.feed('{"tool_args": {"a": "xyz'))
+        parser.feed('y", "b": 1}}')
+        self.assertEqual(copied, {"tool_args": {"a": "xyz"}})
+
+    def test_split_escapes(self):
+        parser, _ = feed_chunks('{"a": "x\\n\\u00e9\\ud83d\\ude00\\"y"}', 1)
+        self.assertEqual(parser.finish(), {"a": 'x\né\U0001F600"y'})
+
+    def test_split_multiline_string(self):
+        parser, _ = feed_chunks("{'code': '''\nline 1\nline 2\n'''}", 1)
+        self.assertEqual(parser.finish(), {"code": "line 1\nline 2"})
+
+    def test_nested_objects_close(self):
+        parser, _ = feed_chunks('{"a": {"b": 1}} {"c": 2}', 4)
+        self.assertTrue(parser.done)
+        self.assertEqual(parser.result, {"a": {"b": 1}})
+
+    def test_strict_and_dirty_paths_agree(self):
+        strict = '{"tool_name": "response", "tool_args": {"text": "a\\nb \\u00e9", "n": [1, 2.5, true, null]}}'
+        dirty = "{tool_name: response, 'tool_args': {text: 'a\\nb \\u00e9', n: [1, 2.5, True, null]"
+        self.assertEqual(DirtyJson.parse_string(strict), DirtyJson.parse_string(dirty))
+
+    def test_unfinished_input(self):
+        parser, _ = feed_chunks('{"a": 12, "b": tr', 3)
+        self.assertEqual(parser.finish(), {"a": 12, "b": "tr"})
+
+
+if __name__ == '__main__':
+    unittest.main()
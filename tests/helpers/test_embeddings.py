@@ -0,0 +1,52 @@
+import threading, time, unittest
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.embeddings import Embeddings
+from python.helpers import embeddings
+
+
+class SlowEmbeddings(Embeddings):
+    # queries are embedded differently from documents, every call takes a fixed time
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self.lock: self.calls.append(len(texts))
+        time.sleep(self.delay)
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.delay)
+        return [-float(len(text))]
+
+
+class TestBatchedEmbeddings(unittest.TestCase):
+    def test_queries_run_concurrently(self):
+        batcher = embeddings.BatchedEmbeddings(SlowEmbeddings(0.2))
+        start = time.monotonic()
+        with ThreadPoolExecutor(4) as pool:
+            vectors = list(pool.map(batcher.embed_query, ["a", "bb", "ccc", "dddd"]))
+        self.assertEqual(vectors, [[-1.0], [-2.0], [-3.0], [-4.0]])
+        self.assertLess(time.monotonic() - start, 0.6)
+
+    def test_query_not_behind_documents(self):
+        batcher = embeddings.BatchedEmbeddings(SlowEmbeddings(0.5))
+        documents = threading.Thread(target=batcher.embed_documents, args=(["text"] * 10,))
+        documents.start()
+        time.sleep(0.05)
+        start = time.monotonic()
+        self.assertEqual(batcher.embed_query("query"), [-5.0])
+        self.assertLess(time.monotonic() - start, 0.8)
+        documents.join()
+
+    def test_large_request_split(self):
+        model = SlowEmbeddings(0)
+        batcher = embeddings.BatchedEmbeddings(model)
+        texts = [str(i) for i in range(embeddings.BATCH_MAX_TEXTS * 2 + 1)]
+        self.assertEqual(batcher.embed_documents(texts), [[float(len(text))] for text in texts])
+        self.assertTrue(all(count <= embeddings.BATCH_MAX_TEXTS for count in model.calls))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,33 @@
+import asyncio, time, unittest
+from python.helpers.rate_limiter import RateLimiter, get_limiter
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_waits_for_the_window(self):
+        limiter = RateLimiter(max_calls=2, max_input_tokens=0, max_output_tokens=0, window_seconds=1)
+        async def calls():
+            for _ in range(3): await limiter.limit_call_and_input(10)
+        start = time.time()
+        asyncio.run(calls())
+        self.assertGreaterEqual(time.time() - start, 0.9) # third call waited for the first to leave the window
+
+    def test_input_tokens_counted(self):
+        limiter = RateLimiter(max_calls=0, max_input_tokens=100, max_output_tokens=0, window_seconds=60)
+        asyncio.run(limiter.limit_call_and_input(60))
+        self.assertEqual(limiter._get_wait_reasons(30), [])
+        self.assertEqual(limiter._get_wait_reasons(50), ["max input tokens"])
+
+    def test_output_tokens_of_record(self):
+        limiter = RateLimiter(max_calls=0, max_input_tokens=0, max_output_tokens=100, window_seconds=60)
+        first = asyncio.run(limiter.limit_call_and_input(1))
+        asyncio.run(limiter.limit_call_and_input(1))
+        limiter.set_output_tokens(100, first) # streamed response of the earlier call
+        self.assertEqual(first.output_tokens, 100)
+        self.assertEqual(limiter._get_wait_reasons(1), ["max output tokens"])
+
+    def test_shared_per_key(self):
+        self.assertIs(get_limiter("test/model", 1, 0, 0), get_limiter("test/model", 5, 0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import os, shutil, tempfile, time, unittest
+from types import SimpleNamespace
+from python.helpers import response_cache
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache_dir = response_cache.CACHE_DIR
+        response_cache.CACHE_DIR = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(response_cache.CACHE_DIR, ignore_errors=True)
+        response_cache.CACHE_DIR = self.cache_dir
+
+    def test_put_and_get(self):
+        model = SimpleNamespace(model_name="test", temperature=0)
+        self.assertTrue(response_cache.is_cacheable(model))
+        key = response_cache.get_key(model, "system", "message")
+        self.assertNotEqual(key, response_cache.get_key(model, "system message", ""))
+        self.assertIsNone(response_cache.get(key, 0))
+        response_cache.put(key, "response", 0)
+        self.assertEqual(response_cache.get(key, 0), "response")
+
+    def test_expired_entry_removed(self):
+        response_cache.put("old", "response", 0)
+        time.sleep(0.05)
+        self.assertIsNone(response_cache.get("old", 0.01))
+        self.assertFalse(os.listdir(response_cache.CACHE_DIR))
+
+    def test_least_recently_used_evicted(self):
+        for key in ["a", "b", "c"]:
+            response_cache.put(key, "x" * 100, 0)
+            os.utime(os.path.join(response_cache.CACHE_DIR, f"{key}.json"), (time.time() - 10, time.time() - 10))
+        response_cache.get("a", 0) # used last
+        response_cache.evict(300)
+        self.assertEqual(response_cache.get("a", 0), "x" * 100)
+        self.assertIsNone(response_cache.get("b", 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
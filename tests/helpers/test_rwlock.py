@@ -0,0 +1,50 @@
+import threading, time, unittest
+from python.helpers.rwlock import RWLock
+
+
+class TestRWLock(unittest.TestCase):
+    def test_readers_share_the_lock(self):
+        lock = RWLock()
+        inside = threading.Barrier(3, timeout=2) # all readers hold the lock at once or the barrier times out
+        def read():
+            with lock.read(): inside.wait()
+        threads = [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads: thread.start()
+        for thread in threads: thread.join()
+        self.assertFalse(inside.broken)
+
+    def test_writer_excludes_readers(self):
+        lock = RWLock()
+        events = []
+        def read():
+            with lock.read(): events.append("read")
+        with lock.write():
+            reader = threading.Thread(target=read)
+            reader.start()
+            time.sleep(0.1)
+            events.append("write done")
+        reader.join()
+        self.assertEqual(events, ["write done", "read"])
+
+    def test_waiting_writer_blocks_new_readers(self):
+        lock = RWLock()
+        events = []
+        def write():
+            with lock.write(): events.append("write")
+        def read():
+            with lock.read(): events.append("read")
+        with lock.read():
+            writer = threading.Thread(target=write)
+            writer.start()
+            time.sleep(0.1) # writer is waiting for the first reader
+            reader = threading.Thread(target=read)
+            reader.start()
+            time.sleep(0.1)
+            self.assertEqual(events, [])
+        writer.join()
+        reader.join()
+        self.assertEqual(events, ["write", "read"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import asyncio, os, shutil, sys, tempfile, time, unittest
+from unittest import mock
+from python.helpers import tool_registry
+from python.helpers.tool import Tool
+
+TOOL = '''from python.helpers.tool import Tool, Response
+
+class EchoTool(Tool):
+    async def execute(self, **kwargs):
+        return Response(message="{message}", break_loop=False)
+'''
+
+
+class FakeLog:
+    def __init__(self):
+        self.items = []
+
+    def log(self, type, heading=None, content=None, kvps=None):
+        self.items.append((type, content))
+
+
+class TestToolRegistry(unittest.TestCase):
+    def test_tools_folder_loaded(self):
+        tool_class = tool_registry.get("response")
+        self.assertTrue(tool_class and issubclass(tool_class, Tool))
+        self.assertIsNone(tool_registry.get("no_such_tool"))
+
+
+class TestToolReload(unittest.TestCase):
+    # a tools folder of its own, registry state is swapped for the test
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.package = "reload_test_tools"
+        os.makedirs(os.path.join(self.dir, self.package))
+        open(os.path.join(self.dir, self.package, "__init__.py"), "w").close()
+        sys.path.insert(0, self.dir)
+        self.patch = mock.patch.multiple(tool_registry, TOOLS_DIR=os.path.join(self.dir, self.package), TOOLS_PACKAGE=self.package, RELOAD_CHECK_SECONDS=0,
+            _tools={}, _files={}, _errors={}, _loaded=False, _load_entry_points=lambda log: None)
+        self.patch.start()
+
+    def tearDown(self):
+        self.patch.stop()
+        sys.path.remove(self.dir)
+        for name in [name for name in sys.modules if name.startswith(self.package)]: del sys.modules[name]
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def write(self, name, content):
+        path = os.path.join(self.dir, self.package, name + ".py")
+        with open(path, "w") as f: f.write(content)
+        mtime = time.time() + len(tool_registry._files) + 1 # distinct mtime on coarse file systems
+        os.utime(path, (mtime, mtime))
+
+    def message(self, tool_class):
+        return asyncio.run(tool_class.execute(None)).message
+
+    def test_changes_picked_up_by_get(self):
+        self.assertIsNone(tool_registry.get("echo"))
+        self.write("echo", TOOL.format(message="one"))
+        self.assertEqual(self.message(tool_registry.get("echo")), "one") # new file
+        self.write("echo", TOOL.format(message="two"))
+        self.assertEqual(self.message(tool_registry.get("echo")), "two") # edited file
+        os.remove(os.path.join(self.dir, self.package, "echo.py"))
+        self.assertIsNone(tool_registry.get("echo")) # removed file
+
+    def test_broken_tool_reported(self):
+        self.write("broken", "raise ValueError('broken tool')")
+        log = FakeLog()
+        with self.assertRaises(ValueError):
+            tool_registry.get("broken", log)
+        self.assertEqual(log.items[0][0], "error")
+        self.assertIn("broken tool", log.items[0][1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import math, shutil, tempfile, unittest
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from python.helpers.vector_db import VectorDB
+
+
+class RotatingEmbeddings(Embeddings):
+    # "step i" is a unit vector rotated by i * 10 degrees, neighbouring steps are near-duplicates at 0.95, steps two apart are not
+    model = "rotating"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        angle = math.radians(10 * int(text.split()[-1])) if text.startswith("step") else math.pi
+        return [math.cos(angle), math.sin(angle)] + [0.0] * 14
+
+
+class FakeLogger:
+    def __init__(self):
+        self.items = []
+
+    def log(self, type, heading=None, content=None, kvps=None):
+        self.items.append(content or "")
+
+
+class TestVectorDBDedup(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.logger = FakeLogger()
+        self.db = VectorDB(self.logger, RotatingEmbeddings(), in_memory=True, memory_dir=self.dir, knowledge_dir="", dedup_threshold=0.95)
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def texts(self):
+        return sorted(doc.page_content for doc in self.db.search_similarity("step 0", 100))
+
+    def test_insert_skips_duplicate(self):
+        first = self.db.insert_text("step 0")
+        self.assertEqual(self.db.insert_text("step 1"), first)
+        self.assertEqual(self.texts(), ["step 0"])
+        self.assertIn(first, self.logger.items[-1]) # dropped memory is reported
+
+    def test_consolidate_does_not_chain(self):
+        self.db.insert_documents([Document(f"step {i}", metadata={"area": "main", "created": i}) for i in range(8)])
+        self.assertEqual(self.db.consolidate(), 4) # each removed step is next to a newer kept one
+        self.assertEqual(self.texts(), ["step 1", "step 3", "step 5", "step 7"])
+        self.assertIn("removed 4 near-duplicates", self.logger.items[-1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import shutil, tempfile, unittest
+from unittest import mock
+import faiss
+import numpy as np
+from python.helpers import vector_index
+from python.helpers.vector_db import VectorDB
+from tests.helpers.test_vector_db_replay import FakeEmbeddings, FakeLogger
+
+
+class TestVectorDBQuantization(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def open(self):
+        return VectorDB(FakeLogger(), FakeEmbeddings(), in_memory=True, memory_dir=self.dir, knowledge_dir="", quantization="sq8", index_promote_at=0)
+
+    def test_sq8_inserted_one_by_one(self):
+        with mock.patch.object(vector_index, "SQ8_TRAIN_MIN", 20):
+            db = self.open()
+            for i in range(30):
+                db.insert_text(f"memory {i}")
+                self.assertEqual(db.search_similarity_threshold(f"memory {i}", 1, 0.99)[0].page_content, f"memory {i}")
+            self.assertEqual(vector_index.get_quantization(db.db.index), "sq8") # trained once the store was large enough
+            self.assertEqual(db.delete_documents_by_query("memory 3", 0.99), 1)
+            db.close()
+
+    def test_undertrained_sq8_retrained_on_load(self):
+        with mock.patch.object(vector_index, "SQ8_TRAIN_MIN", 20):
+            db = self.open()
+            for i in range(30): db.insert_text(f"memory {i}")
+            # codec of an older store trained on its first vector only
+            labels = vector_index.get_labels(db.db.index)
+            vectors = np.array(db.db.docstore.get_vectors([db.db.index_to_docstore_id[label] for label in labels]), dtype=np.float32) # type: ignore
+            index = faiss.index_factory(16, "SQ8")
+            index.train(vectors[:1])
+            db.db.index = vector_index.wrap(index)
+            db.db.index.add_with_ids(vectors, labels)
+            self.assertTrue(vector_index.is_undertrained(db.db.index))
+            db.pending_ops += 1
+            db.close()
+
+            db = self.open()
+            self.assertFalse(vector_index.is_undertrained(db.db.index))
+            self.assertEqual(db.search_similarity_threshold("memory 7", 1, 0.99)[0].page_content, "memory 7")
+            db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
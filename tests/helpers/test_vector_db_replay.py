@@ -0,0 +1,133 @@
+import hashlib, os, shutil, tempfile, unittest
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from python.helpers.vector_db import VectorDB
+
+
+class FakeEmbeddings(Embeddings):
+    model = "fake"
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        vector = np.random.default_rng(int(hashlib.md5(text.encode()).hexdigest()[:8], 16)).normal(size=16)
+        return (vector / np.linalg.norm(vector)).tolist()
+
+
+class FakeLogger:
+    def log(self, *args, **kwargs):
+        pass
+
+
+class TestVectorDBReplay(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+    def open(self, **kwargs):
+        # no background snapshots, tests decide when to compact
+        return VectorDB(FakeLogger(), FakeEmbeddings(), in_memory=True, memory_dir=self.dir, knowledge_dir="", compact_ops=10000, compact_seconds=10 ** 9, **kwargs)
+
+    def crash(self, db):
+        # process ends without a final snapshot
+        db.oplog.close()
+        db.db.docstore.close()
+
+    def texts(self, db):
+        return sorted(doc.page_content for doc in db.search_similarity("memory", 100))
+
+    def test_replay_after_crash(self):
+        db = self.open()
+        for i in range(3): db.insert_text(f"memory {i}")
+        self.crash(db)
+        db = self.open()
+        self.assertEqual(self.texts(db), ["memory 0", "memory 1", "memory 2"])
+        db.close()
+
+    def test_roll_forward_interrupted_snapshot(self):
+        db = self.open()
+        for i in range(3): db.insert_text(f"memory {i}")
+        db.finish_snapshot = lambda: None # snapshot files written, crash before they replace the old ones
+        db.compact()
+        db.insert_text("memory 3") # after the snapshot, in the new log
+        self.crash(db)
+        self.assertTrue(os.path.exists(os.path.join(db.db_dir, "snapshot.ready")))
+
+        db = self.open()
+        self.assertFalse(os.path.exists(os.path.join(db.db_dir, "snapshot.ready")))
+        self.assertFalse(os.path.exists(db.compacting_path))
+        self.assertEqual(db.db.index.ntotal, 4)
+        self.assertEqual(self.texts(db), ["memory 0", "memory 1", "memory 2", "memory 3"])
+        db.close()
+
+    def test_torn_last_line(self):
+        db = self.open()
+        for i in range(2): db.insert_text(f"memory {i}")
+        self.crash(db)
+        with open(db.oplog.path, "a", encoding="utf-8") as f:
+            f.write('{"op": "add", "ids": ["torn"') # write cut short by the crash
+
+        db = self.open()
+        self.assertEqual(self.texts(db), ["memory 0", "memory 1"])
+        db.insert_text("memory 2") # log is usable after the torn line
+        self.crash(db)
+        db = self.open()
+        self.assertEqual(self.texts(db), ["memory 0", "memory 1", "memory 2"])
+        db.close()
+
+    def test_replay_is_idempotent(self):
+        db = self.open()
+        ids = [db.insert_text(f"memory {i}") for i in range(3)]
+        db.delete_documents_by_ids(ids[:1])
+        self.crash(db)
+        with open(db.oplog.path, encoding="utf-8") as f:
+            log = f.read()
+        with open(db.oplog.path, "a", encoding="utf-8") as f:
+            f.write(log) # every operation twice
+        db = self.open()
+        self.assertEqual(db.db.index.ntotal, 2)
+        self.assertEqual(self.texts(db), ["memory 1", "memory 2"])
+
+        db.flush()
+        self.crash(db)
+        with open(db.oplog.path, "w", encoding="utf-8") as f:
+            f.write(log) # operations already in the snapshot
+        db = self.open()
+        self.assertEqual(db.db.index.ntotal, 2)
+        self.assertEqual(self.texts(db), ["memory 1", "memory 2"])
+        db.close()
+
+    def test_hnsw_tombstones(self):
+        db = self.open(index_type="hnsw", index_promote_at=0)
+        ids = [db.insert_text(f"memory {i}") for i in range(10)]
+        db.delete_documents_by_ids(ids[:2]) # graph keeps the nodes, searches skip them
+        self.assertEqual(db.db.index.ntotal, 10)
+        self.assertEqual(self.texts(db), [f"memory {i}" for i in range(2, 10)])
+        self.crash(db)
+        db = self.open(index_type="hnsw", index_promote_at=0)
+        self.assertEqual(len(db.tombstones), 2)
+        self.assertEqual(self.texts(db), [f"memory {i}" for i in range(2, 10)])
+
+        db.flush() # snapshot rebuilds the graph without them
+        self.assertEqual(db.db.index.ntotal, 8)
+        self.assertFalse(db.tombstones)
+        self.assertEqual(self.texts(db), [f"memory {i}" for i in range(2, 10)])
+        db.close()
+
+    def test_closed_rejects_changes(self):
+        db = self.open()
+        db.insert_text("memory 0")
+        db.close()
+        with self.assertRaises(RuntimeError):
+            db.insert_text("memory 1") # nothing reaches the log of a closed store
+        db = self.open()
+        self.assertEqual(self.texts(db), ["memory 0"])
+        self.assertFalse(db.pending_ops)
+        db.close()
+
+
+if __name__ == '__main__':
+    unittest.main()